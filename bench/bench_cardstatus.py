@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# Headless end-to-end benchmarks for the hot paths of the plugin:
+#   - OscamConfig.getSavedEmm on unique EMM logs of 1k, 100k and 1M lines
+#     (first read, unchanged log, appended lines, restart with saved index)
+#   - CardStatus.getCardStatus against recorded webif responses, and
+#     CardStatus.getCardStatusAll for several Sky readers
+#   - OscamWebif.extractPayloads on a logpoll response
+#   - reading the Sky reader from status documents of 500 and 5000 clients,
+#     against parsing the whole document
+#   - CardStatus.getOscamTempdir on the real /proc
+#
+# enigma2 and twisted are replaced by the modules in stubs/. The webif is
+# answered by a requests transport adapter serving the documents from
+# oscamdata.py, so request counts are those of the real OscamWebif code.
+#
+# Every case runs in its own interpreter, so peak memory is per case.
+#
+# Usage: python bench_cardstatus.py [case ...]
+#
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH, '..', 'plugin'))
+sys.path.insert(0, os.path.join(BENCH, 'stubs'))
+
+import oscamdata
+
+def peakMemory():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, (time.time() - start) * 1000
+
+#
+# requests transport adapter answering from a table of documents.
+#
+def recordedAdapter(responses):
+    import requests
+
+    class RecordedAdapter(requests.adapters.BaseAdapter):
+        def send(self, request, **kwargs):
+            r = requests.models.Response()
+            r.url = request.url
+            r.request = request
+            r.connection = self
+            r.encoding = 'utf-8'
+            r.status_code = 404
+            r._content = ''
+            for part, body in responses:
+                if part in request.url:
+                    r.status_code = 200
+                    r._content = body
+                    break
+            return r
+
+        def close(self):
+            pass
+
+    return RecordedAdapter()
+
+#
+# Temporary Oscam temp dir and config dir with oscam.version and oscam.conf.
+#
+def oscamDirs():
+    root = tempfile.mkdtemp(prefix='oss-bench-')
+    tempdir = os.path.join(root, 'tmp')
+    confdir = os.path.join(root, 'conf')
+    os.mkdir(tempdir)
+    os.mkdir(confdir)
+    with open(os.path.join(tempdir, 'oscam.version'), 'wb') as f:
+        f.write("Version:        oscam-1.20-unstable_svn-r11306\n"
+                "ConfigDir:      %s\n"
+                "WebifPort:      8888\n"
+                "Web interface support: yes\n"
+                "LiveLog support:       yes\n" % confdir)
+    with open(os.path.join(confdir, 'oscam.conf'), 'wb') as f:
+        f.write("[global]\nemmlogdir = %s\n\n[webif]\nhttpport = 8888\n"
+                "httpuser = bench\nhttppwd = bench\nhttpallowed = 127.0.0.1\n" % confdir)
+    return root, tempdir, confdir
+
+def benchEmm(lines):
+    from OscamStatus import OscamConfig
+    root, tempdir, confdir = oscamDirs()
+    try:
+        logfile = os.path.join(confdir, 'sky-v14_unique_emm.log')
+        oscamdata.writeEmmLog(logfile, lines)
+        size = os.path.getsize(logfile)
+        result = { 'lines': lines, 'bytes': size }
+
+        config = OscamConfig(confdir)
+        emm, result['first read ms'] = timed(config.getSavedEmm, 'sky-v14')
+        result['emms'] = len(emm['emm'])
+        result['lines/s'] = int(lines / (result['first read ms'] / 1000))
+        emm, result['unchanged ms'] = timed(config.getSavedEmm, 'sky-v14')
+
+        with open(logfile, 'ab') as log:
+            for line in oscamdata.emmLogLines(1000, seed=4):
+                log.write(line)
+        emm, result['append 1000 ms'] = timed(config.getSavedEmm, 'sky-v14')
+
+        config = OscamConfig(confdir)
+        emm, result['restart ms'] = timed(config.getSavedEmm, 'sky-v14')
+        result['index kB'] = config.emmlogs['sky-v14']['log'].memoryReport()['total'] // 1024
+        return result
+    finally:
+        shutil.rmtree(root)
+
+def benchCardStatus(clients, readers, allReaders=False):
+    import OscamStatus
+
+    responses = [ ('part=status', oscamdata.statusDocument(clients, readers)) ]
+    for label, caid, reportsCaid in readers:
+        responses.append(('part=entitlement&label=%s' % label, oscamdata.entitlementDocument(caid)))
+
+    root, tempdir, confdir = oscamDirs()
+    for label, caid, reportsCaid in readers:
+        if caid in oscamdata.SKY_CAIDS:
+            oscamdata.writeEmmLog(os.path.join(confdir, '%s_unique_emm.log' % label), 1000)
+
+    class BenchCardStatus(OscamStatus.CardStatus):
+        def getOscamInformation(self):
+            self.readOscamVersion(tempdir)
+
+        def getOscamWebif(self):
+            webif = OscamStatus.CardStatus.getOscamWebif(self)
+            webif.session.mount('http://', recordedAdapter(responses))
+            return webif
+
+    try:
+        status, ms = timed(lambda: BenchCardStatus(None))
+        dummy, getms = timed(status.getCardStatusAll if allReaders else status.getCardStatus)
+        stats = status.webif.getRequestStats()
+        result = { 'clients': clients, 'readers': len(readers), 'reader': status.status and status.status['reader'],
+                   'expires': status.expires, 'emms': len(status.list or []) - 1,
+                   'setup ms': ms, 'getCardStatus ms': getms,
+                   'requests': stats['requests'], 'roundtrips': stats['roundtrips'] }
+        if allReaders:
+            result['sky readers'] = ' '.join('%s:%s' % (state['status']['reader'], state['expires'])
+                                             for state in status.readers)
+        return result
+    finally:
+        shutil.rmtree(root)
+
+def benchPayload(lines):
+    import OscamStatus
+    webif = OscamStatus.OscamWebif('127.0.0.1', '8888')
+    logpoll = unicode(oscamdata.logpollDocument(lines))
+    payloads, ms = timed(webif.extractPayloads, logpoll)
+    return { 'lines': lines, 'bytes': len(logpoll), 'payloads': len(payloads), 'extractPayloads ms': ms }
+
+#
+# getStatusSky before streaming: parse the whole document, walk all entries.
+#
+def referenceStatusSky(status, skyCaids):
+    obj = json.loads(status)
+    for client in obj['oscam']['status']['client']:
+        conn = client['connection']
+        if conn['$'] == 'CARDOK':
+            for ent in conn['entitlements']:
+                if ent['caid'] in skyCaids:
+                    return { 'reader': client['rname_enc'], 'caid': ent['caid'] }
+    return None
+
+def benchStatus(clients, readersFirst):
+    import OscamStatus
+    readers = [('hd01', '1830', True), ('sky-v14', '098C', True), ('sky-v13', '09C4', True)]
+    status = unicode(oscamdata.statusDocument(clients, readers, readersFirst))
+    webif = OscamStatus.OscamWebif('127.0.0.1', '8888')
+    webif.getStatus = lambda: status
+    result = { 'clients': clients, 'bytes': len(status), 'readers first': readersFirst }
+    rounds = 20
+    found, ms = timed(lambda: [referenceStatusSky(status, webif.SKY_CAIDS) for i in range(rounds)])
+    result['json.loads ms'] = ms / rounds
+    result['reference'] = found[0]['reader']
+    found, ms = timed(lambda: [webif.getStatusSky() for i in range(rounds)])
+    result['getStatusSky ms'] = ms / rounds
+    result['reader'] = found[0]['reader']
+    found, ms = timed(lambda: [webif.getStatusSkyAll() for i in range(rounds)])
+    result['getStatusSkyAll ms'] = ms / rounds
+    return result
+
+def benchDiscovery():
+    import OscamStatus
+    class Probe(OscamStatus.CardStatus):
+        def __init__(self):
+            pass
+    probe = Probe()
+    tempdir, cold = timed(probe.getOscamTempdir)
+    tempdir, warm = timed(probe.getOscamTempdir)
+    return { 'processes': len([p for p in os.listdir('/proc') if p.isdigit()]), 'tempdir': tempdir,
+             'first ms': cold, 'second ms': warm }
+
+CASES = [
+    ('emm-1k',            lambda: benchEmm(1000)),
+    ('emm-100k',          lambda: benchEmm(100000)),
+    ('emm-1m',            lambda: benchEmm(1000000)),
+    ('cardstatus',        lambda: benchCardStatus(50, [('sky-v14', '098C', True)])),
+    ('cardstatus-500',    lambda: benchCardStatus(500, [('sky-v14', '098C', True)])),
+    ('cardstatus-fanout', lambda: benchCardStatus(50, [('hd01', '1830', False), ('hd02', '1843', False),
+                                                        ('cccam', '0D95', False), ('sky-v13', '09C4', False)])),
+    ('cardstatus-multi',  lambda: benchCardStatus(50, [('hd01', '1830', False), ('sky-v13', '09C4', False),
+                                                        ('sky-v14', '098C', True)], True)),
+    ('payload-5k',        lambda: benchPayload(5000)),
+    ('status-500',        lambda: benchStatus(500, False)),
+    ('status-5000',       lambda: benchStatus(5000, False)),
+    ('status-5000-first', lambda: benchStatus(5000, True)),
+    ('discovery',         benchDiscovery),
+]
+
+def runCase(name):
+    # keep the plugin's log output out of the result line
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        import OscamStatus
+        baseline = peakMemory()
+        result = dict(CASES)[name]()
+        result['peak kB'] = peakMemory()
+        result['peak delta kB'] = result['peak kB'] - baseline
+    finally:
+        sys.stdout = stdout
+    print json.dumps(result)
+
+def main(names):
+    for name in names or [name for name, case in CASES]:
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--run', name])
+        result = json.loads(out.splitlines()[-1])
+        print name
+        for key in sorted(result):
+            value = result[key]
+            if isinstance(value, float):
+                value = '%.2f' % value
+            print "  %-20s %s" % (key, value)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        runCase(sys.argv[2])
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+#
+# Cost of loading the plugin, each case in a fresh interpreter:
+#   enumerate - what enigma2 does at boot: import the plugin package and
+#               build the plugin descriptors
+#   open      - the same, then import OscamStatus like main() does when
+#               the plugin is started
+#
+# The plugin is loaded as Plugins.Extensions.OscamSkydeStatus like on a
+# receiver, enigma2 is replaced by the modules in stubs/. Reports the
+# median time, the modules loaded and if locale setup has run.
+#
+# Usage: python bench_import.py [--rounds 15] [case ...]
+#
+import json
+import optparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+
+def runCase(name, extensions):
+    sys.path.insert(0, os.path.join(BENCH, 'stubs'))
+    import Plugins.Extensions
+    Plugins.Extensions.__path__.append(extensions)
+    before = len(sys.modules)
+
+    # keep the plugin's log output out of the result line
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        from Plugins.Extensions.OscamSkydeStatus import plugin
+        plugin.Plugins()
+        if name == 'open':
+            import Plugins.Extensions.OscamSkydeStatus.OscamStatus
+        ms = (time.time() - start) * 1000
+    finally:
+        sys.stdout = stdout
+    locale = sys.modules['Plugins.Extensions.OscamSkydeStatus.__init__'].localeInit.done
+    print json.dumps({ 'ms': ms, 'modules': len(sys.modules) - before, 'locale setup': locale })
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [--rounds N] [case ...]")
+    parser.add_option('--rounds', type='int', default=15)
+    options, names = parser.parse_args()
+
+    # the plugin directory under the name it has on a receiver
+    extensions = tempfile.mkdtemp(prefix='oss-bench-')
+    os.symlink(os.path.join(BENCH, '..', 'plugin'), os.path.join(extensions, 'OscamSkydeStatus'))
+    try:
+        for name in names or ['enumerate', 'open']:
+            results = []
+            for i in range(options.rounds):
+                out = subprocess.check_output([sys.executable, '-B', os.path.abspath(__file__), '--run', name, extensions])
+                results.append(json.loads(out.splitlines()[-1]))
+            results.sort(key=lambda result: result['ms'])
+            result = results[len(results) // 2]
+            print "%-10s %7.1f ms  %4d modules  locale setup %s" % (name, result['ms'], result['modules'], result['locale setup'])
+    finally:
+        shutil.rmtree(extensions)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        runCase(sys.argv[2], sys.argv[3])
+    else:
+        main()
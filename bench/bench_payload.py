@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#
+# Benchmark live log payload scanning against a logpoll.html response.
+#
+# Usage: python bench_payload.py [logpoll.json]
+#
+# Without argument a response with the shape and line mix of Oscam at
+# debug level 4 is generated.
+#
+import base64
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'plugin'))
+from Payload import PayloadScanner
+from oscamdata import logpollDocument
+
+#
+# Scanner as used before: decode every line, regex per call.
+#
+def referenceScan(logpoll):
+    payloads = []
+    lines = json.loads(logpoll)['oscam']['lines']
+    foundPayloadHeader = False
+    lookAhead = 2
+    for line in lines:
+        decoded = base64.b64decode(line['line'])
+        if foundPayloadHeader:
+            lookAhead -= 1
+            if lookAhead == 0:
+                m = re.search('(0F 0[46] .. .. .. .. .. ..)', decoded)
+                if m:
+                    payloads.append(m.group(1))
+                foundPayloadHeader = False
+                continue
+        if 'Decrypted payload' in decoded:
+            lookAhead = 2
+            foundPayloadHeader = True
+    return payloads
+
+#
+# Same as OscamWebif.extractPayloads
+#
+def scannerScan(logpoll):
+    scanner = PayloadScanner()
+    if not scanner.isPending() and not scanner.hasMarker(logpoll):
+        return []
+    return scanner.scanLines(json.loads(logpoll)['oscam']['lines'])
+
+def bench(title, logpoll):
+    lines = json.loads(logpoll)['oscam']['lines']
+    assert referenceScan(logpoll) == scannerScan(logpoll)
+    print "%s: %d lines, %d bytes, %d payloads" % (title, len(lines), len(logpoll), len(scannerScan(logpoll)))
+    for name, func in (('reference', referenceScan), ('scanner', scannerScan)):
+        best = min(timeit.repeat(lambda: func(logpoll), number=20, repeat=5)) / 20
+        print "  %-10s %8.2f ms per response" % (name, best * 1000)
+
+def main():
+    if len(sys.argv) > 1:
+        bench(sys.argv[1], unicode(open(sys.argv[1], 'rb').read()))
+    else:
+        bench('with payload', unicode(logpollDocument()))
+        bench('without payload', unicode(logpollDocument(payloads=0)))
+
+if __name__ == '__main__':
+    main()
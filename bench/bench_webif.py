@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# Round trips and wall time per UI action against the fake Oscam webif.
+#
+# Actions:
+#   open     - what opening the screen does: find Sky reader, read tiers
+#   reopen   - the same on a second screen open (shared webif object)
+#   writeemm - write one EMM and read tiers again
+#   batch    - write up to 5 EMMs until the expire date moves (the fake
+#              webif extends the card with every 3rd EMM)
+#   payload  - switch to debug level 4 and poll the live log for a payload
+#   fanout   - find all Sky readers, entitlements read in parallel
+#
+# After the first action every request must take one round trip.
+#
+# Usage: python bench_webif.py [--latency 100] [--errors 0.05] [--readers 4]
+#
+import optparse
+import os
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH, '..', 'plugin'))
+sys.path.insert(0, os.path.join(BENCH, 'stubs'))
+
+from fakewebif import FakeWebif
+
+def action(server, webif, name, func):
+    server.reset()
+    before = webif.getRequestStats()
+    start = time.time()
+    try:
+        result = func()
+    except Exception as e:
+        result = 'failed: %s' % e
+    ms = (time.time() - start) * 1000
+    after = webif.getRequestStats()
+    recorded = server.summary()
+    print "%-9s %8.1f ms  requests %2d  round trips %2d  server saw %2d  %s" % (
+        name, ms, after['requests'] - before['requests'], after['roundtrips'] - before['roundtrips'],
+        sum(recorded.values()), result)
+    for key, count in sorted(recorded.items()):
+        print "%30d  %s" % (count, key)
+    return after['requests'] - before['requests'], after['roundtrips'] - before['roundtrips']
+
+def openScreen(webif):
+    status = webif.getStatusSky()
+    if status:
+        return webif.getTiers(status['reader'])['expires']
+    return None
+
+def fetchPayload(webif):
+    import OscamStatus
+    webif.payloadScanner = OscamStatus.PayloadScanner()
+    webif.logpollId = None
+    # like fetchPayload, which the poll is started from
+    webif.payloadActive = True
+    webif._startPayloadPoll(webif._get(webif.webif + '/logpoll.html?debug=4'))
+    deadline = time.time() + webif.PAYLOAD_TIMEOUT / 1000.0
+    payload = None
+    while payload is None and time.time() < deadline:
+        time.sleep(webif.PAYLOAD_POLL / 1000.0)
+        payload = webif.pollPayload()
+    webif.payloadActive = False
+    webif._get(webif.webif + '/logpoll.html?debug=0')
+    return payload
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--latency', type='int', default=50)
+    parser.add_option('--jitter', type='int', default=0)
+    parser.add_option('--errors', type='float', default=0.0)
+    parser.add_option('--clients', type='int', default=50)
+    parser.add_option('--readers', type='int', default=1, help='CARDOK readers, Sky reader last')
+    options, args = parser.parse_args()
+
+    readers = [('reader%d' % i, '1830', False) for i in range(options.readers - 1)]
+    readers.append(('sky-v14', '098C', options.readers == 1))
+    server = FakeWebif(latency=options.latency, jitter=options.jitter, errors=options.errors,
+                       clients=options.clients, readers=readers, payloadAfter=1.5, extendAfter=3)
+    server.start()
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    import OscamStatus
+    webif = OscamStatus.OscamWebif('127.0.0.1', str(server.port), 'user', 'pass')
+    sys.stdout = stdout
+
+    def quiet(func):
+        def run():
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                return func()
+            finally:
+                sys.stdout = stdout
+        return run
+
+    print "latency %d ms, errors %.0f%%, %d clients, %d readers" % (
+        options.latency, options.errors * 100, options.clients, options.readers)
+    # the first request is challenged, after that every request of every
+    # thread reuses the nonce: one round trip per request
+    action(server, webif, 'open', quiet(lambda: openScreen(webif)))
+    counts = []
+    counts.append(action(server, webif, 'reopen', quiet(lambda: openScreen(webif))))
+    counts.append(action(server, webif, 'writeemm', quiet(lambda: webif.writeEmm('sky-v14', '098C', '82708E0000') or
+                                                                  webif.getTiers('sky-v14')['expires'])))
+    webif.EMM_PAUSE = 100
+    emms = ['82708E00000%d' % i for i in range(5)]
+    def batch():
+        result = webif.writeEmms('sky-v14', '098C', emms)
+        return '%d of %d written, %s -> %s' % (result['written'], len(emms), result['before'], result['tiers']['expires'])
+    counts.append(action(server, webif, 'batch', quiet(batch)))
+    payloads = []
+    counts.append(action(server, webif, 'payload', quiet(lambda: payloads.append(fetchPayload(webif)) or payloads[-1])))
+    webif.tiersCache.clear()
+    counts.append(action(server, webif, 'fanout', quiet(lambda: webif.getStatusSkyAll())))
+    webif.session.close()
+    time.sleep(0.1)
+    server.stop()
+    requests, roundTrips = [sum(column) for column in zip(*counts)]
+    assert roundTrips == requests, "%d round trips for %d requests after warm-up" % (roundTrips, requests)
+    assert payloads and payloads[0], "no payload found in the live log"
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+#
+# Local stand-in for the Oscam web interface, for load and latency tests
+# of OscamWebif without a real card.
+#
+# Serves oscamapi.json?part=status, oscamapi.json?part=entitlement,
+# logpoll.html and emm_running.html behind HTTP digest auth like Oscam
+# does. Latency, error rate, number of clients and readers, and live log
+# volume are configurable. Every request is recorded.
+#
+# Usage: python fakewebif.py [--port 8888] [--latency 200] [--errors 0.1] ...
+#        see --help. Or from Python:
+#
+#   server = FakeWebif(latency=200)
+#   server.start()
+#   ... OscamWebif('127.0.0.1', str(server.port), 'user', 'pass') ...
+#   server.stop()
+#   print server.requests
+#
+import BaseHTTPServer
+import SocketServer
+import base64
+import hashlib
+import json
+import optparse
+import os
+import random
+import re
+import threading
+import time
+import urlparse
+
+import oscamdata
+
+class Settings:
+    def __init__(self, **kwargs):
+        self.user = 'user'
+        self.password = 'pass'
+        self.realm = 'Forbidden'
+        self.nonceLifetime = 120       # s, like Oscam's nonce expiry
+        self.latency = 0               # ms per request
+        self.jitter = 0                # ms, added at random
+        self.errors = 0.0              # share of requests failing with 500
+        self.drops = 0.0               # share of requests closed without answer
+        self.clients = 5               # user clients in status document
+        self.readers = [('sky-v14', '098C', True)]
+        self.expireDate = '2017-12-31T00:00:00+0100'
+        self.extendAfter = 0           # EMM writes until expire date moves, 0: never
+        self.logRate = 50              # live log lines per second
+        self.logBuffer = 2000          # lines kept in the live log
+        self.payloadAfter = 2.0        # s after debug=4 until payload is logged, <0: never
+        self.payload = '0F 06 00 10 00 00 00 00'
+        for key in kwargs:
+            if not hasattr(self, key):
+                raise TypeError("unknown setting %s" % key)
+            setattr(self, key, kwargs[key])
+
+class LiveLog:
+    """Live log ring buffer, filled at logRate lines per second."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.lines = []
+        self.lastid = 0
+        self.filled = time.time()
+        self.debugSince = None
+        self.payloadLogged = False
+        self.rnd = random.Random(5)
+
+    def _append(self, text):
+        self.lastid += 1
+        self.lines.append({ 'id': str(self.lastid), 'typ': 'r', 'line': base64.b64encode(text) })
+
+    def _fill(self):
+        now = time.time()
+        count = int((now - self.filled) * self.settings.logRate)
+        if count:
+            self.filled += float(count) / self.settings.logRate
+        for i in range(count):
+            date = time.strftime('%Y/%m/%d %H:%M:%S')
+            self._append(self.rnd.choice(oscamdata.NOISE) % (date, '%032X' % self.rnd.getrandbits(128), self.lastid))
+        if self.debugSince is not None and not self.payloadLogged and self.settings.payloadAfter >= 0 \
+                and now - self.debugSince >= self.settings.payloadAfter:
+            date = time.strftime('%Y/%m/%d %H:%M:%S')
+            self._append("%s 4F2B1C r      sky-v14 [videoguard2] Decrypted payload" % date)
+            self._append("%s 4F2B1C r      sky-v14 [videoguard2] 0000: 00 00 00 00" % date)
+            self._append("%s 4F2B1C r      sky-v14 [videoguard2] 0000: %s" % (date, self.settings.payload))
+            self.payloadLogged = True
+        del self.lines[:-self.settings.logBuffer]
+
+    def poll(self, debug=None, lastid=None):
+        with self.lock:
+            self._fill()
+            if debug == '4' and self.debugSince is None:
+                self.debugSince = time.time()
+                self.payloadLogged = False
+            elif debug == '0':
+                self.debugSince = None
+            lines = self.lines
+            if lastid is not None:
+                lines = [line for line in lines if int(line['id']) > int(lastid)]
+            return json.dumps({ 'oscam': { 'lastid': str(self.lastid), 'lines': lines } })
+
+class FakeWebif:
+    def __init__(self, port=0, **kwargs):
+        self.settings = Settings(**kwargs)
+        self.livelog = LiveLog(self.settings)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.nonces = {}
+        self.emmWrites = []
+        self.expireDate = self.settings.expireDate
+        self.rnd = random.Random(6)
+        self.server = ThreadedServer(('127.0.0.1', port), Handler)
+        self.server.fake = self
+        self.port = self.server.server_address[1]
+        self.thread = None
+        self.stopped = False
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped = True
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.requests = []
+
+    #
+    # @return dict - number of recorded requests per path and status
+    #
+    def summary(self):
+        with self.lock:
+            counts = {}
+            for r in self.requests:
+                key = '%s %s' % (r['path'], r['status'])
+                counts[key] = counts.get(key, 0) + 1
+            return counts
+
+    def record(self, entry):
+        with self.lock:
+            self.requests.append(entry)
+
+    def newNonce(self):
+        nonce = hashlib.md5('%f%d' % (time.time(), self.rnd.getrandbits(64))).hexdigest()
+        with self.lock:
+            self.nonces[nonce] = time.time()
+        return nonce
+
+    #
+    # Check digest Authorization header.
+    #
+    # @return string - 'ok', 'stale' or 'fail'
+    #
+    def checkAuth(self, method, header):
+        if not header or not header.startswith('Digest '):
+            return 'fail'
+        params = dict((k, v1 or v2) for k, v1, v2 in re.findall(r'(\w+)=(?:"([^"]*)"|([^,\s]*))', header[7:]))
+        s = self.settings
+        if params.get('username') != s.user or params.get('realm') != s.realm:
+            return 'fail'
+        ha1 = hashlib.md5('%s:%s:%s' % (s.user, s.realm, s.password)).hexdigest()
+        ha2 = hashlib.md5('%s:%s' % (method, params.get('uri'))).hexdigest()
+        if params.get('qop'):
+            expected = hashlib.md5('%s:%s:%s:%s:%s:%s' % (ha1, params.get('nonce'), params.get('nc'),
+                                   params.get('cnonce'), params.get('qop'), ha2)).hexdigest()
+        else:
+            expected = hashlib.md5('%s:%s:%s' % (ha1, params.get('nonce'), ha2)).hexdigest()
+        if params.get('response') != expected:
+            return 'fail'
+        with self.lock:
+            issued = self.nonces.get(params.get('nonce'))
+        if issued is None or time.time() - issued > s.nonceLifetime:
+            return 'stale'
+        return 'ok'
+
+    def answer(self, path, query):
+        if path == '/oscamapi.json' and query.get('part') == 'status':
+            return oscamdata.statusDocument(self.settings.clients, self.settings.readers)
+        if path == '/oscamapi.json' and query.get('part') == 'entitlement':
+            for label, caid, reportsCaid in self.settings.readers:
+                if label == query.get('label'):
+                    return oscamdata.entitlementDocument(caid, self.expireDate)
+            return json.dumps({ 'oscam': { 'entitlements': [] } })
+        if path == '/logpoll.html':
+            return self.livelog.poll(query.get('debug'), query.get('lastid'))
+        if path == '/emm_running.html':
+            with self.lock:
+                self.emmWrites.append(query.get('ep'))
+                if self.settings.extendAfter and len(self.emmWrites) % self.settings.extendAfter == 0:
+                    year = int(self.expireDate[0:4]) + 1
+                    self.expireDate = '%04d%s' % (year, self.expireDate[4:])
+            return '<html><body>EMM written</body></html>'
+        return None
+
+class ThreadedServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def handle_error(self, request, client_address):
+        # keep-alive connections of a stopped server, dropped requests
+        if not self.fake.stopped:
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status, body='', headers=()):
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        fake = self.server.fake
+        s = fake.settings
+        start = time.time()
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        entry = { 'time': start, 'path': url.path, 'query': query, 'client': self.client_address[1] }
+
+        if s.latency or s.jitter:
+            time.sleep((s.latency + fake.rnd.random() * s.jitter) / 1000.0)
+
+        auth = fake.checkAuth('GET', self.headers.get('Authorization'))
+        if auth != 'ok':
+            stale = ', stale=true' if auth == 'stale' else ''
+            challenge = 'Digest realm="%s", qop="auth", opaque="%s", nonce="%s"%s' % (
+                s.realm, hashlib.md5(s.realm).hexdigest(), fake.newNonce(), stale)
+            entry['status'] = 401
+            fake.record(entry)
+            self.send(401, 'Unauthorized', [('WWW-Authenticate', challenge)])
+            return
+
+        roll = fake.rnd.random()
+        if roll < s.drops:
+            entry['status'] = 'drop'
+            fake.record(entry)
+            self.close_connection = 1
+            self.wfile.close()
+            return
+        if roll < s.drops + s.errors:
+            entry['status'] = 500
+            fake.record(entry)
+            self.send(500, 'Internal error')
+            return
+
+        body = fake.answer(url.path, query)
+        entry['status'] = 200 if body is not None else 404
+        entry['bytes'] = len(body or '')
+        entry['ms'] = (time.time() - start) * 1000
+        fake.record(entry)
+        contentType = 'application/json' if url.path != '/emm_running.html' else 'text/html'
+        self.send(entry['status'], body or 'Not found', [('Content-Type', contentType)])
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('--port', type='int', default=8888)
+    parser.add_option('--user', default='user')
+    parser.add_option('--password', default='pass')
+    parser.add_option('--latency', type='int', default=0, help='ms per request')
+    parser.add_option('--jitter', type='int', default=0, help='random extra ms per request')
+    parser.add_option('--errors', type='float', default=0.0, help='share of requests answered with 500')
+    parser.add_option('--drops', type='float', default=0.0, help='share of requests closed without answer')
+    parser.add_option('--clients', type='int', default=5, help='user clients in status')
+    parser.add_option('--log-rate', type='int', default=50, help='live log lines per second')
+    parser.add_option('--payload-after', type='float', default=2.0, help='s after debug=4 until payload, <0: never')
+    options, args = parser.parse_args()
+
+    server = FakeWebif(options.port, user=options.user, password=options.password,
+                       latency=options.latency, jitter=options.jitter, errors=options.errors,
+                       drops=options.drops, clients=options.clients, logRate=options.log_rate,
+                       payloadAfter=options.payload_after)
+    print "fake Oscam webif on http://127.0.0.1:%d (%s/%s)" % (server.port, options.user, options.password)
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    for key, count in sorted(server.summary().items()):
+        print "%6d  %s" % (count, key)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Generators for Oscam data in the formats the plugin reads: webif API
+# documents (status, entitlement, logpoll) and unique EMM log files.
+#
+import base64
+import collections
+import json
+import random
+
+SKY_CAIDS = ['09C4', '098C', '09B6']
+
+NOISE = [
+    "%s 4F2B1C c      (ecm) dvbapi (09C4@000000/0000/2EE3/B6FB/64:%s): found (%d ms) by sky-v14",
+    "%s 4F2B1C r      sky-v14 [videoguard2] card system %s status request (%d)",
+    "%s 4F2B1C r      sky-v14 [videoguard2] ins7E: %s %d",
+    "%s 5A1D00 c      (dvbapi) Demuxer %s %d has 2 ecmpids, 0 streampids",
+]
+
+#
+# oscamapi.json?part=status
+#
+# @param clients int - number of connected user clients
+# @param readers list - (label, caid, reportsCaid) of CARDOK readers;
+#                       reportsCaid False: caid only known from entitlements
+# @param readersFirst bool - readers before or after the user clients
+#
+# Like Oscam, every entry starts with its "type" key.
+#
+def statusDocument(clients=5, readers=(('sky-v14', '098C', True),), readersFirst=False):
+    random.seed(2)
+    entries = []
+    for i in range(clients):
+        entries.append({
+            'type': 'c', 'name': 'user%d' % i, 'desc': '', 'protocol': 'cccam',
+            'protocolext': '', 'au': '0', 'rname_enc': 'user%d' % i,
+            'ip': '192.168.0.%d' % (i % 250 + 2), 'port': '0',
+            'request': { 'caid': '098C', 'srvid': '%04X' % random.getrandbits(16),
+                         'ecmtime': str(random.randint(100, 600)), 'answered': 'sky-v14', '$': 'Sky Cinema' },
+            'times': { 'login': '2017-06-14T10:00:00+0200', 'online': '3600', 'idle': '0' },
+            'connection': { 'ip': '192.168.0.%d' % (i % 250 + 2), 'port': '0', '$': 'OK' },
+        })
+    for label, caid, reportsCaid in readers:
+        entries.append({
+            'type': 'r', 'name': label, 'desc': '', 'protocol': 'internal',
+            'protocolext': '', 'au': '1', 'rname_enc': label, 'ip': '', 'port': '0',
+            'request': { 'caid': caid, 'srvid': '0000', 'ecmtime': '0', 'answered': '', '$': '' },
+            'times': { 'login': '2017-06-14T10:00:00+0200', 'online': '3600', 'idle': '0' },
+            'connection': { 'ip': '', 'port': '0', 'details': '', '$': 'CARDOK',
+                            'entitlements': [ { 'caid': caid, 'provid': '000000', 'exp': '2017-12-31T00:00:00' } ] if reportsCaid else [] },
+        })
+    ordered = []
+    for entry in entries:
+        ordered.append(collections.OrderedDict([('type', entry.pop('type'))] + sorted(entry.items())))
+    if readersFirst:
+        ordered = ordered[clients:] + ordered[:clients]
+    return json.dumps({ 'oscam': { 'version': '1.20-unstable_svn build r11306', 'status': { 'client': ordered } } })
+
+#
+# oscamapi.json?part=entitlement&label=<reader>
+#
+def entitlementDocument(caid='098C', expireDate='2017-12-31T00:00:00+0100', tiers=20):
+    lines = [ { 'caid': caid, 'provid': '000000', 'id': '00000000000000%02X' % t, 'class': '00',
+                'startDate': '2016-12-31T00:00:00+0100', 'expireDate': expireDate, 'type': '1' }
+              for t in range(tiers) ]
+    lines.append( { 'caid': caid, 'provid': '000000', 'id': '00000000000000F0', 'class': '00',
+                    'startDate': '2016-12-31T00:00:00+0100', 'expireDate': expireDate, 'type': '1' } )
+    return json.dumps({ 'oscam': { 'version': '1.20-unstable_svn build r11306', 'entitlements': lines } })
+
+#
+# logpoll.html
+#
+def logpollDocument(lines=5000, payloads=3, firstId=0):
+    random.seed(1)
+    out = []
+    blocks = set(random.sample(range(lines - 3), payloads))
+    i = 0
+    while i < lines:
+        date = "2017/06/14 12:%02d:%02d" % (i // 60 % 60, i % 60)
+        if i in blocks:
+            text = [
+                "%s 4F2B1C r      sky-v14 [videoguard2] Decrypted payload" % date,
+                "%s 4F2B1C r      sky-v14 [videoguard2] 0000: 00 00 00 00" % date,
+                "%s 4F2B1C r      sky-v14 [videoguard2] 0000: 0F 06 00 10 00 00 00 00 %02X" % (date, i % 256),
+            ]
+        else:
+            text = [random.choice(NOISE) % (date, "%032X" % random.getrandbits(128), i)]
+        for t in text:
+            out.append({ 'id': str(firstId + i), 'typ': 'r', 'line': base64.b64encode(t) })
+            i += 1
+    return json.dumps({ 'oscam': { 'lastid': str(firstId + i), 'lines': out } })
+
+#
+# <reader>_unique_emm.log lines
+#
+# @param lines int - number of lines
+# @param keys int - number of distinct EMMs
+#
+def emmLogLines(lines, keys=None, seed=3):
+    rnd = random.Random(seed)
+    keys = keys or max(100, lines // 50)
+    pool = [ '82708E0000%08X' % rnd.getrandbits(32) + ''.join('%02X' % rnd.getrandbits(8) for j in range(60))
+             for i in range(keys) ]
+    for i in range(lines):
+        date = "2017/%02d/%02d %02d:%02d:%02d" % (i // 86400 % 12 + 1, i // 3600 % 28 + 1, i // 60 % 24, i % 60, i * 7 % 60)
+        yield "%s %016X %s  blocked\n" % (date, 0x1234567890ABCDEF, pool[rnd.randrange(keys)])
+
+def writeEmmLog(path, lines, keys=None):
+    with open(path, 'wb') as log:
+        for line in emmLogLines(lines, keys):
+            log.write(line)
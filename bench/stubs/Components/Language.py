@@ -0,0 +1,7 @@
+class Language:
+    def getLanguage(self):
+        return "de_DE"
+    def addCallback(self, callback):
+        pass
+
+language = Language()
@@ -0,0 +1,11 @@
+class ScrollLabel:
+    def __init__(self, text=""):
+        self.text = text
+    def setText(self, text):
+        self.text = text
+    def getText(self):
+        return self.text
+    def pageUp(self):
+        pass
+    def pageDown(self):
+        pass
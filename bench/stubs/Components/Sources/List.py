@@ -0,0 +1,22 @@
+class List:
+    def __init__(self, list=None):
+        self.list = list or []
+        self.index = 0
+        self.onSelectionChanged = []
+    def setList(self, list):
+        self.list = list
+        self.index = 0
+    def updateList(self, list):
+        self.list = list
+    def modifyEntry(self, index, data):
+        self.list[index] = data
+    def getCurrent(self):
+        if 0 <= self.index < len(self.list):
+            return self.list[self.index]
+        return None
+    def getIndex(self):
+        return self.index
+    def setIndex(self, index):
+        self.index = index
+    def count(self):
+        return len(self.list)
@@ -0,0 +1,8 @@
+class PluginDescriptor:
+    WHERE_PLUGINMENU = 0
+    WHERE_SESSIONSTART = 1
+    def __init__(self, name="Plugin", where=None, description="", icon=None, fnc=None, **kwargs):
+        self.name = name
+        self.where = where
+        self.description = description
+        self.__call__ = fnc
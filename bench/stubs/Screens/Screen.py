@@ -0,0 +1,8 @@
+class Screen(dict):
+    def __init__(self, session):
+        self.session = session
+        self.onLayoutFinish = []
+        self.onClose = []
+    def close(self, *retval):
+        for f in self.onClose:
+            f()
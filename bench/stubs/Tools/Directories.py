@@ -0,0 +1,6 @@
+import os
+
+SCOPE_PLUGINS = 0
+
+def resolveFilename(scope, path=""):
+    return os.path.join("/usr/lib/enigma2/python/Plugins", path)
@@ -0,0 +1,4 @@
+notifications = []
+
+def AddNotification(screen, *args, **kwargs):
+    notifications.append((screen, args, kwargs))
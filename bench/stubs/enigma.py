@@ -0,0 +1,38 @@
+# enigma2 stand-in for headless benchmarks
+
+class eTimer:
+    def __init__(self):
+        self.callback = []
+        self.timeout = self.callback
+    def start(self, msec, singleShot=False):
+        pass
+    def stop(self):
+        pass
+    def isActive(self):
+        return False
+
+class eSize:
+    def __init__(self, w, h):
+        self.w = w
+        self.h = h
+    def width(self):
+        return self.w
+    def height(self):
+        return self.h
+
+class eDesktop:
+    def size(self):
+        return eSize(1280, 720)
+
+def getDesktop(screen):
+    return eDesktop()
+
+class iServiceInformation:
+    sONID = 1
+    sIsCrypted = 2
+
+class eSocketNotifier:
+    Read = 1
+    def __init__(self, fd, requested):
+        self.fd = fd
+        self.callback = []
@@ -0,0 +1,4 @@
+# Calls from worker threads run right away, see threads.py.
+
+def callFromThread(func, *args, **kwargs):
+    func(*args, **kwargs)
@@ -0,0 +1,41 @@
+# Runs the function right away and returns an already fired deferred.
+
+class Deferred:
+    def __init__(self, result, failed):
+        self.result = result
+        self.failed = failed
+
+    def addCallbacks(self, callback, errback):
+        try:
+            if self.failed:
+                self.result = errback(self.result)
+            else:
+                self.result = callback(self.result)
+            self.failed = False
+        except Exception as e:
+            self.result = Failure(e)
+            self.failed = True
+        return self
+
+    def addCallback(self, callback):
+        return self.addCallbacks(callback, lambda failure: failure)
+
+    def addErrback(self, errback):
+        if self.failed:
+            return self.addCallbacks(lambda result: result, errback)
+        return self
+
+    def addBoth(self, callback):
+        return self.addCallbacks(callback, callback)
+
+class Failure:
+    def __init__(self, exception):
+        self.value = exception
+    def getErrorMessage(self):
+        return str(self.value)
+
+def deferToThread(func, *args, **kwargs):
+    try:
+        return Deferred(func(*args, **kwargs), False)
+    except Exception as e:
+        return Deferred(Failure(e), True)
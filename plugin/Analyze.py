@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# Offline analysis of logs collected from receivers, without enigma2.
+#
+# Unique EMM logs (<reader>_unique_emm.log, rotated ones included) are
+# read with EmmLogReader and merged into one first/last seen report per
+# EMM. Other logs (oscam.log, oscam.log.1.gz, ...) are searched for
+# payloads and merged into a timeline of card states, see PayloadTimeline.
+#
+# Logs are spread over a process pool, one unique EMM log with its
+# rotated logs or one Oscam log per task. Readers are reported as
+# <directory>/<label>, the directory relative to the path given, so logs
+# of several receivers can be analyzed at once: one directory per receiver.
+#
+# Usage: python Analyze.py [options] directory|file ...
+#        see --help
+#
+import csv
+import json
+import multiprocessing
+import optparse
+import os
+import re
+import sys
+import time
+
+from EmmLog import EmmLogReader
+from Payload import PayloadClassifier, PayloadTimeline
+from Trace import trace
+
+EMMLOG = re.compile(r'(.+_unique_emm\.log)(\.\d+(\.gz)?|\.gz)?$')
+
+EMM_FIELDS = ['emm', 'first', 'last', 'count', 'logs', 'readers']
+PAYLOAD_FIELDS = ['reader', 'state', 'text', 'first', 'last', 'count', 'firstPayload', 'lastPayload']
+
+#
+# Find the logs to analyze.
+#
+# @param paths list - directories (searched recursively) and files
+# @return list - tasks: tuples of kind ('emm' or 'payload'), file name
+#                and source directory label
+#
+def findTasks(paths):
+    tasks = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            root = os.path.abspath(path)
+            for directory, dirnames, filenames in os.walk(root):
+                dirnames.sort()
+                source = os.path.relpath(directory, os.path.dirname(root))
+                for name in sorted(filenames):
+                    addTask(tasks, seen, os.path.join(directory, name), source)
+        else:
+            addTask(tasks, seen, os.path.abspath(path), os.path.basename(os.path.dirname(os.path.abspath(path))))
+    return tasks
+
+def addTask(tasks, seen, path, source):
+    directory, name = os.path.split(path)
+    m = EMMLOG.match(name)
+    if m:
+        # one task for a log and its rotated logs, EmmLogReader finds those
+        task = ('emm', os.path.join(directory, m.group(1)), source)
+    elif '.log' in name:
+        task = ('payload', path, source)
+    else:
+        return
+    if task not in seen:
+        seen.add(task)
+        tasks.append(task)
+
+#
+# Worker: read one log.
+#
+# @param task tuple - see findTasks
+# @return dict - task, ms, lines or error, and EMMs (hex, first, last,
+#                count) or payloads (date, reader, payload)
+#
+def runTask(task):
+    kind, path, source = task
+    result = { 'task': task }
+    start = time.time()
+    try:
+        if kind == 'emm':
+            emmlog = EmmLogReader(path)
+            emmlog.update()
+            result['lines'] = emmlog.linesRead
+            result['emms'] = [ (emmlog.hexKey(emmlog.keys[slot]), emmlog.first[slot], emmlog.last[slot], emmlog.count[slot])
+                               for slot in range(len(emmlog)) ]
+        else:
+            timeline = PayloadTimeline(None)
+            timeline.addFile(path)
+            result['payloads'] = timeline.payloads
+    except (IOError, OSError, EOFError) as e:
+        result['error'] = str(e)
+    result['ms'] = (time.time() - start) * 1000
+    return result
+
+#
+# @param timestamp int - UTC timestamp from EmmLogReader
+# @return string - date as in the log
+#
+def formatDate(timestamp):
+    return time.strftime("%Y/%m/%d %H:%M:%S", time.gmtime(timestamp))
+
+class Report:
+    """Results of all tasks, merged."""
+
+    def __init__(self, classifier):
+        # EMM -> first, last, count, logs, readers
+        self.emms = {}
+        self.timeline = PayloadTimeline(classifier)
+        self.files = []
+
+    def add(self, result):
+        kind, path, source = result['task']
+        entry = { 'kind': kind, 'path': path, 'ms': round(result['ms'], 1) }
+        if 'error' in result:
+            entry['error'] = result['error']
+        elif kind == 'emm':
+            reader = source + '/' + os.path.basename(path)[:-len('_unique_emm.log')]
+            for key, first, last, count in result['emms']:
+                emm = self.emms.get(key)
+                if emm is None:
+                    self.emms[key] = [first, last, count, 1, set([reader])]
+                else:
+                    emm[0] = min(emm[0], first)
+                    emm[1] = max(emm[1], last)
+                    emm[2] += count
+                    emm[3] += 1
+                    emm[4].add(reader)
+            entry['lines'] = result['lines']
+            entry['emms'] = len(result['emms'])
+        else:
+            for date, reader, payload in result['payloads']:
+                self.timeline.payloads.append((date, source + '/' + reader, payload))
+            entry['payloads'] = len(result['payloads'])
+        self.files.append(entry)
+
+    #
+    # @return list - dicts with EMM_FIELDS, seen last first, same order
+    #                however many workers
+    #
+    def emmRows(self):
+        rows = []
+        for key in sorted(self.emms, key=lambda key: (-self.emms[key][1], key)):
+            first, last, count, logs, readers = self.emms[key]
+            rows.append({ 'emm': key, 'first': formatDate(first), 'last': formatDate(last),
+                          'count': count, 'logs': logs, 'readers': ' '.join(sorted(readers)) })
+        return rows
+
+    #
+    # @return list - dicts with PAYLOAD_FIELDS, see PayloadTimeline.periods
+    #
+    def payloadRows(self):
+        return self.timeline.periods()
+
+    def writeJson(self, out):
+        json.dump({ 'emms': self.emmRows(), 'payloads': self.payloadRows(),
+                    'files': sorted(self.files, key=lambda entry: entry['path']) },
+                  out, indent=1, sort_keys=True)
+        out.write('\n')
+
+    def writeCsv(self, out, fields, rows):
+        writer = csv.DictWriter(out, fields, extrasaction='ignore')
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+
+def main(args):
+    parser = optparse.OptionParser(usage="%prog [options] directory|file ...")
+    parser.add_option('-f', '--format', choices=['json', 'csv'], default='json')
+    parser.add_option('-o', '--output', help='output file, for csv the prefix of <prefix>-emms.csv '
+                                             'and <prefix>-payloads.csv; default stdout')
+    parser.add_option('-j', '--jobs', type='int', default=multiprocessing.cpu_count(),
+                      help='worker processes, default: number of cores')
+    parser.add_option('--payloads', default=PayloadClassifier.FILE, help='payload states, see payloads.conf')
+    options, paths = parser.parse_args(args)
+    if not paths:
+        parser.error("no directory or file given")
+
+    # stdout is for the report
+    trace.setLevel(trace.OFF, trace.OFF)
+
+    start = time.time()
+    tasks = findTasks(paths)
+    classifier = PayloadClassifier()
+    if not classifier.load(options.payloads):
+        sys.stderr.write("can't read %s, payload states unknown\n" % options.payloads)
+    report = Report(classifier)
+    if options.jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(options.jobs, len(tasks)))
+        try:
+            for result in pool.imap_unordered(runTask, tasks):
+                report.add(result)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            report.add(runTask(task))
+
+    for entry in report.files:
+        if 'error' in entry:
+            sys.stderr.write("%s: %s\n" % (entry['path'], entry['error']))
+
+    if options.format == 'json':
+        out = open(options.output, 'wb') if options.output else sys.stdout
+        try:
+            report.writeJson(out)
+        finally:
+            if options.output:
+                out.close()
+    elif options.output:
+        for suffix, fields, rows in (('-emms.csv', EMM_FIELDS, report.emmRows()),
+                                     ('-payloads.csv', PAYLOAD_FIELDS, report.payloadRows())):
+            with open(options.output + suffix, 'wb') as out:
+                report.writeCsv(out, fields, rows)
+    else:
+        report.writeCsv(sys.stdout, EMM_FIELDS, report.emmRows())
+        sys.stdout.write('\n')
+        report.writeCsv(sys.stdout, PAYLOAD_FIELDS, report.payloadRows())
+
+    sys.stderr.write("%d EMM logs, %d Oscam logs: %d EMMs, %d payloads in %.1f s\n" % (
+        len([task for task in tasks if task[0] == 'emm']), len([task for task in tasks if task[0] == 'payload']),
+        len(report.emms), len(report.timeline.payloads), time.time() - start))
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+import array
+import binascii
+import calendar
+import gzip
+import heapq
+import os
+import re
+import struct
+import sys
+import zlib
+
+from Trace import trace
+
+class EmmLogReader:
+    """Incremental reader for an Oscam <reader>_unique_emm.log file.
+
+    Remembers inode and byte offset of the log file, so that subsequent
+    calls only parse the lines appended since the last call. If the file
+    was truncated or replaced (rotation), it is read again from the start.
+
+    If an index file is given, the seen index (key -> first, last, count)
+    and the read position are kept on disk, so the index survives plugin
+    restarts as well as truncation or loss of the log file.
+
+    Rotated logs next to the log file (<log>.1, <log>.2.gz, <log>.gz, ...)
+    are merged into the same index, compressed ones are read as a stream.
+    An archive is only read again when its size or mtime has changed, an
+    archive renamed by numbered rotation is not read again. If the log
+    was rotated by renaming, only the part of the renamed file
+    not read yet is taken. An archive compressed or copied from lines
+    already read adds to their count once more; first and last seen are
+    not affected by that.
+
+    The seen index is kept compact: EMMs are binary strings, first and
+    last seen are UTC timestamps, and first, last and count live in
+    arrays indexed by a slot number per EMM. If maxEntries is given, only
+    the EMMs seen last are kept.
+
+    Does not depend on enigma2.
+    """
+
+    LINE = re.compile(r"(\d{4}/\d{2}/\d{2}) (\d{2}:\d{2}):(\d{2})\s+[0-9A-Z]{16}\s+([0-9A-F]+)\s+")
+
+    # Index file layout: header, archive table, followed by appended
+    # records. A later record for the same key replaces an earlier one.
+    # An index of another version is ignored and built again from the logs.
+    INDEX_MAGIC   = 'OSSI'
+    INDEX_VERSION = 2
+    INDEX_HEADER  = struct.Struct('>4sHQQd')    # magic, version, inode, offset, mtime
+    INDEX_COUNT   = struct.Struct('>H')         # number of archives
+    INDEX_ARCHIVE = struct.Struct('>HdQ')       # length of file name, mtime, size
+    INDEX_KEYLEN  = struct.Struct('>H')         # number of hex digits of key
+    INDEX_RECORD  = struct.Struct('>III')       # first, last, count
+
+    # suffix of rotated logs
+    ARCHIVE = re.compile(r"\.(\d+(\.gz)?|gz)$")
+
+    # HH:MM -> seconds since midnight
+    MINUTES = dict(('%02d:%02d' % (h, m), h * 3600 + m * 60) for h in range(24) for m in range(60))
+
+    def __init__(self, logfile, indexfile=None, maxEntries=None):
+        self.logfile = logfile
+        self.indexfile = indexfile
+        self.maxEntries = maxEntries
+        # file name of rotated log -> mtime and size when it was read
+        self.archives = {}
+        self.clear()
+        self.dirty = set()
+        # slots saved to the index, but not yet taken by takeChanged
+        self.changed = set()
+        # counts up when slots are renumbered
+        self.generation = 0
+        self.records = 0
+        self.compact = True
+        # lines and bytes read from log and rotated logs so far
+        self.linesRead = 0
+        self.bytesRead = 0
+        # day (YYYY/MM/DD) -> timestamp of midnight UTC
+        self.days = {}
+        self.rewind()
+        if indexfile:
+            self.load()
+
+    def clear(self):
+        self.slots = {}
+        self.keys = []
+        self.first = array.array('I')
+        self.last = array.array('I')
+        self.count = array.array('I')
+
+    def __len__(self):
+        return len(self.keys)
+
+    #
+    # Forget the read position, so the log is read from the start next time.
+    # The seen index is kept.
+    #
+    def rewind(self):
+        self.inode = None
+        self.offset = 0
+        self.mtime = 0
+
+    #
+    # Forget everything read so far.
+    #
+    def reset(self):
+        self.rewind()
+        self.clear()
+        self.dirty = set()
+        self.changed = set()
+        self.generation += 1
+
+    #
+    # @param key string - binary EMM
+    # @return string - EMM as hex digits, like in the log
+    #
+    def hexKey(self, key):
+        return binascii.hexlify(key).upper()
+
+    #
+    # @param key string - binary EMM
+    # @return tuple|None - first and last seen timestamp and count
+    #
+    def getEntry(self, key):
+        slot = self.slots.get(key)
+        if slot is None:
+            return None
+        return (self.first[slot], self.last[slot], self.count[slot])
+
+    #
+    # Parse one log line into the seen index.
+    #
+    # @param line string - line from unique EMM log
+    # @return bool - True if line contained an EMM
+    #
+    def addLine(self, line):
+        m = self.LINE.search(line.rstrip())
+        # EMMs are whole bytes
+        if m and not len(m.group(4)) & 1:
+            day, minute, second, key = m.groups()
+            try:
+                date = self.days[day]
+            except KeyError:
+                date = calendar.timegm((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0))
+                self.days[day] = date
+            try:
+                date += self.MINUTES[minute]
+            except KeyError:
+                return False
+            date += int(second)
+            key = binascii.unhexlify(key)
+            slot = self.slots.get(key)
+            if slot is None:
+                slot = len(self.keys)
+                self.slots[key] = slot
+                self.keys.append(key)
+                self.first.append(date)
+                self.last.append(date)
+                self.count.append(1)
+            else:
+                if self.first[slot] > date:
+                    self.first[slot] = date
+                if self.last[slot] < date:
+                    self.last[slot] = date
+                self.count[slot] += 1
+            self.dirty.add(slot)
+            return True
+        return False
+
+    #
+    # Read lines appended to the log file since the last call, and rotated
+    # logs that are new or have changed, in one pass merged by date.
+    # A trailing line without newline is left for the next call, as Oscam
+    # may still be writing it.
+    #
+    # @return bool - True if new lines were read since the last call
+    # @raise OSError, IOError - if neither the log file nor a rotated log
+    #                           can be read
+    #
+    def update(self):
+        streams = []
+        archives = self.findArchives()
+        # numbered rotation renames archives: .1 -> .2 -> ...
+        known = set(self.archives.values())
+        for name in archives:
+            stat = archives[name]
+            signature = (stat.st_mtime, stat.st_size)
+            if self.archives.get(name) == signature:
+                continue
+            if signature in known:
+                self.archives[name] = signature
+                self.compact = True
+            else:
+                # the log file read so far, renamed: skip the part already read
+                renamed = stat.st_ino == self.inode and not name.endswith('.gz')
+                streams.append(self._readArchive(name, stat, self.offset if renamed else 0))
+
+        try:
+            stat = os.stat(self.logfile)
+        except OSError:
+            if not archives:
+                raise
+            stat = None
+
+        if stat is None:
+            self.rewind()
+        elif stat.st_ino != self.inode or stat.st_size < self.offset:
+            if self.inode is not None:
+                trace.info("EmmLogReader.update", "%s rotated or truncated, rescan", self.logfile)
+            self.rewind()
+            self.inode = stat.st_ino
+            streams.append(self._readLog(stat))
+        elif stat.st_size != self.offset or stat.st_mtime != self.mtime:
+            streams.append(self._readLog(stat))
+
+        for name in self.archives.keys():
+            if name not in archives:
+                del self.archives[name]
+                self.compact = True
+        if not streams:
+            return False
+
+        count = 0
+        lines = 0
+        size = 0
+        for line in heapq.merge(*streams):
+            lines += 1
+            size += len(line)
+            count += self.addLine(line)
+        self.linesRead += lines
+        self.bytesRead += size
+        self.prune()
+        return count > 0
+
+    #
+    # @return dict - file name -> os.stat result of rotated logs
+    #
+    def findArchives(self):
+        directory, name = os.path.split(self.logfile)
+        archives = {}
+        try:
+            entries = os.listdir(directory or '.')
+        except OSError:
+            return archives
+        for entry in entries:
+            if entry.startswith(name + '.') and self.ARCHIVE.match(entry, len(name)):
+                path = os.path.join(directory, entry)
+                try:
+                    archives[path] = os.stat(path)
+                except OSError:
+                    pass
+        return archives
+
+    #
+    # Complete lines of the log file from the read position on.
+    # The read position follows the lines taken.
+    #
+    def _readLog(self, stat):
+        self.mtime = stat.st_mtime
+        with open(self.logfile, 'rb') as log:
+            log.seek(self.offset)
+            for line in log:
+                if not line.endswith('\n'):
+                    break
+                self.offset += len(line)
+                yield line
+
+    #
+    # Complete lines of a rotated log, gzip compressed or not.
+    # The archive is remembered as read once all lines are taken.
+    #
+    # @param offset int - where to start in an uncompressed archive
+    #
+    def _readArchive(self, name, stat, offset):
+        trace.info("EmmLogReader.update", "read rotated log %s from %d", name, offset)
+        try:
+            if name.endswith('.gz'):
+                archive = gzip.open(name, 'rb')
+            else:
+                archive = open(name, 'rb')
+            try:
+                archive.seek(offset)
+                for line in archive:
+                    if line.endswith('\n'):
+                        yield line
+            finally:
+                archive.close()
+        except (IOError, EOFError, zlib.error) as e:
+            trace.warn("EmmLogReader.update", "can't read %s: %s", name, e)
+        self.archives[name] = (stat.st_mtime, stat.st_size)
+        self.compact = True
+
+    #
+    # Drop the EMMs seen longest ago if there are more than maxEntries.
+    # Some slack is allowed, so pruning doesn't happen on every update.
+    # Slots are renumbered, generation counts up.
+    #
+    def prune(self):
+        if not self.maxEntries or len(self.keys) <= self.maxEntries + self.maxEntries // 10:
+            return
+        keep = sorted(range(len(self.keys)), key=self.last.__getitem__, reverse=True)[:self.maxEntries]
+        keep.sort()
+        renumber = dict((old, new) for new, old in enumerate(keep))
+        keys, first, last, count = self.keys, self.first, self.last, self.count
+        self.clear()
+        for old in keep:
+            self.slots[keys[old]] = len(self.keys)
+            self.keys.append(keys[old])
+            self.first.append(first[old])
+            self.last.append(last[old])
+            self.count.append(count[old])
+        self.dirty = set(renumber[slot] for slot in self.dirty if slot in renumber)
+        self.changed = set(renumber[slot] for slot in self.changed if slot in renumber)
+        self.generation += 1
+        self.compact = True
+        trace.info("EmmLogReader.prune", "%d of %d EMMs kept", len(keep), len(keys))
+
+    #
+    # @return set - slots of EMMs added or updated since the last call
+    #
+    def takeChanged(self):
+        changed = self.changed | self.dirty
+        self.changed = set()
+        return changed
+
+    #
+    # Estimate memory used by the seen index.
+    #
+    # @return dict - number of EMMs and bytes per part of the index
+    #
+    def memoryReport(self):
+        keyBytes = sum(sys.getsizeof(key) for key in self.keys)
+        arrays = self.first.itemsize * (len(self.first) + len(self.last) + len(self.count))
+        report = {
+            'emms': len(self.keys),
+            'keys': keyBytes,
+            'slots': sys.getsizeof(self.slots) + sys.getsizeof(self.keys),
+            'arrays': arrays,
+            'sets': sys.getsizeof(self.dirty) + sys.getsizeof(self.changed),
+        }
+        report['total'] = report['keys'] + report['slots'] + report['arrays'] + report['sets']
+        return report
+
+    def _packRecord(self, slot):
+        key = self.keys[slot]
+        return self.INDEX_KEYLEN.pack(2 * len(key)) + key + self.INDEX_RECORD.pack(
+            self.first[slot], self.last[slot], self.count[slot])
+
+    def _packHeader(self):
+        return self.INDEX_HEADER.pack(self.INDEX_MAGIC, self.INDEX_VERSION,
+            self.inode or 0, self.offset, self.mtime)
+
+    def _packArchives(self):
+        data = self.INDEX_COUNT.pack(len(self.archives))
+        for name in sorted(self.archives):
+            mtime, size = self.archives[name]
+            data += self.INDEX_ARCHIVE.pack(len(name), mtime, size) + name
+        return data
+
+    #
+    # Read seen index and read position from index file.
+    # A missing or broken index file leaves an empty index.
+    #
+    def load(self):
+        try:
+            with open(self.indexfile, 'rb') as index:
+                data = index.read()
+        except IOError:
+            return
+
+        try:
+            magic, version, inode, offset, mtime = self.INDEX_HEADER.unpack_from(data, 0)
+            if magic != self.INDEX_MAGIC or version != self.INDEX_VERSION:
+                raise ValueError("unknown index format")
+            pos = self.INDEX_HEADER.size
+            archives = {}
+            count, = self.INDEX_COUNT.unpack_from(data, pos)
+            pos += self.INDEX_COUNT.size
+            for i in range(count):
+                namelen, archiveMtime, size = self.INDEX_ARCHIVE.unpack_from(data, pos)
+                pos += self.INDEX_ARCHIVE.size
+                archives[data[pos:pos+namelen]] = (archiveMtime, size)
+                pos += namelen
+        except (struct.error, ValueError) as e:
+            trace.warn("EmmLogReader.load", "ignore broken index %s: %s", self.indexfile, e)
+            return
+
+        records = 0
+        self.clear()
+        try:
+            while pos < len(data):
+                digits, = self.INDEX_KEYLEN.unpack_from(data, pos)
+                pos += self.INDEX_KEYLEN.size
+                keylen = (digits + 1) // 2
+                key = data[pos:pos+keylen]
+                if len(key) != keylen:
+                    raise ValueError("truncated record")
+                pos += keylen
+                first, last, count = self.INDEX_RECORD.unpack_from(data, pos)
+                pos += self.INDEX_RECORD.size
+                slot = self.slots.get(key)
+                if slot is None:
+                    slot = len(self.keys)
+                    self.slots[key] = slot
+                    self.keys.append(key)
+                    self.first.append(first)
+                    self.last.append(last)
+                    self.count.append(count)
+                else:
+                    self.first[slot] = first
+                    self.last[slot] = last
+                    self.count[slot] = count
+                records += 1
+        except (struct.error, ValueError) as e:
+            # interrupted append: keep complete records, read log again
+            trace.warn("EmmLogReader.load", "broken record in %s: %s", self.indexfile, e)
+            archives = {}
+            inode = 0
+            offset = 0
+            mtime = 0
+        else:
+            self.compact = False
+
+        self.archives = archives
+        self.records = records
+        self.inode = inode or None
+        self.offset = offset
+        self.mtime = mtime
+        self.generation += 1
+        trace.info("EmmLogReader.load", "%d EMMs from %s", len(self.keys), self.indexfile)
+        self.prune()
+
+    #
+    # Write changes to index file. Changed entries are appended, the file
+    # is compacted once it holds too many outdated records. If appending
+    # fails, e.g. the index file was removed, the whole file is written.
+    # If that fails too, e.g. the confdir is read-only, the next save tries
+    # again with the whole index, so changed entries need not be kept.
+    #
+    def save(self):
+        if not self.indexfile:
+            return
+        if not self.compact and self.records <= 2 * len(self.keys) + 64:
+            try:
+                with open(self.indexfile, 'r+b') as index:
+                    index.seek(0, os.SEEK_END)
+                    for slot in self.dirty:
+                        index.write(self._packRecord(slot))
+                    index.seek(0)
+                    index.write(self._packHeader())
+                self.records += len(self.dirty)
+            except (IOError, OSError) as e:
+                trace.info("EmmLogReader.save", "can't append to %s, writing it again: %s", self.indexfile, e)
+                self.compact = True
+        else:
+            self.compact = True
+        if self.compact:
+            tmpfile = self.indexfile + '.tmp'
+            try:
+                with open(tmpfile, 'wb') as index:
+                    index.write(self._packHeader())
+                    index.write(self._packArchives())
+                    for slot in range(len(self.keys)):
+                        index.write(self._packRecord(slot))
+                os.rename(tmpfile, self.indexfile)
+                self.records = len(self.keys)
+                self.compact = False
+            except (IOError, OSError) as e:
+                trace.warn("EmmLogReader.save", "can't write %s: %s", self.indexfile, e)
+                try:
+                    os.remove(tmpfile)
+                except OSError:
+                    pass
+        self.changed |= self.dirty
+        self.dirty = set()
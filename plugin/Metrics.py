@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+import bisect
+import json
+import threading
+import time
+
+from Trace import trace
+
+class Histogram:
+    """Counts and latency buckets of one measuring point."""
+
+    # upper bucket bounds in ms, the last bucket takes everything above
+    BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+    # amounts also reported per second
+    RATES = ('bytes', 'lines')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        # counted quantities per call, e.g. bytes or lines
+        self.amounts = {}
+
+    def add(self, ms, amounts=None):
+        self.count += 1
+        self.total += ms
+        if self.min is None or ms < self.min:
+            self.min = ms
+        if self.max is None or ms > self.max:
+            self.max = ms
+        self.buckets[bisect.bisect_left(self.BOUNDS, ms)] += 1
+        if amounts:
+            for name in amounts:
+                self.amounts[name] = self.amounts.get(name, 0) + amounts[name]
+
+    #
+    # @param share float - 0.5 for the median etc.
+    # @return float|None - upper bound of the bucket holding that share, in ms
+    #
+    def percentile(self, share):
+        if not self.count:
+            return None
+        seen = 0
+        for index in range(len(self.buckets)):
+            seen += self.buckets[index]
+            if seen >= share * self.count:
+                if index < len(self.BOUNDS):
+                    return float(min(self.BOUNDS[index], self.max))
+                return self.max
+        return self.max
+
+    #
+    # @return dict - count, total, mean, min, max, p50 and p95 in ms,
+    #                non-empty buckets, amounts and rates
+    #
+    def report(self):
+        buckets = {}
+        for index in range(len(self.buckets)):
+            if self.buckets[index]:
+                if index < len(self.BOUNDS):
+                    buckets['<=%d' % self.BOUNDS[index]] = self.buckets[index]
+                else:
+                    buckets['>%d' % self.BOUNDS[-1]] = self.buckets[index]
+        report = {
+            'count': self.count,
+            'total ms': round(self.total, 1),
+            'mean ms': round(self.total / self.count, 2) if self.count else None,
+            'min ms': round(self.min, 2) if self.count else None,
+            'max ms': round(self.max, 2) if self.count else None,
+            'p50 ms': self.percentile(0.5),
+            'p95 ms': self.percentile(0.95),
+            'buckets': buckets,
+        }
+        for name in self.amounts:
+            report[name] = self.amounts[name]
+            if name in self.RATES and self.total:
+                report[name + '/s'] = int(self.amounts[name] * 1000 / self.total)
+        return report
+
+class Metrics:
+    """Timing of the hot paths: web interface requests by endpoint, reading
+    the unique EMM logs, Oscam discovery and screen rendering.
+
+    Only records while enabled, OscamStatus enables it in debug mode (see
+    isDebug). While disabled, a measuring point costs an attribute lookup,
+    methods decorated with timed an extra call.
+    Measuring points are named "<area> <what>", e.g. "webif status".
+    Thread safe, requests are timed in worker threads.
+
+    Does not depend on enigma2.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.since = time.time()
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+
+    #
+    # Record one call.
+    #
+    # @param name string - measuring point
+    # @param ms float - duration in ms
+    # @param amounts dict|None - quantities handled by the call, e.g. bytes
+    #
+    def add(self, name, ms, amounts=None):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(ms, amounts)
+
+    #
+    # @return dict - measuring point -> Histogram.report(), and seconds
+    #                since recording started
+    #
+    def report(self):
+        with self.lock:
+            points = dict((name, self.histograms[name].report()) for name in self.histograms)
+            return { 'seconds': int(time.time() - self.since), 'points': points }
+
+    #
+    # @return list - text lines, one per measuring point, slowest total first
+    #
+    def reportLines(self):
+        points = self.report()['points']
+        lines = []
+        for name in sorted(points, key=lambda name: points[name]['total ms'], reverse=True):
+            point = points[name]
+            line = "%-34s %5d x  %8.1f ms  p50 %6s  p95 %6s  max %8.1f" % (
+                name, point['count'], point['total ms'], self._ms(point['p50 ms']),
+                self._ms(point['p95 ms']), point['max ms'])
+            for amount in sorted(key for key in point if key.endswith('/s')):
+                line += "  %s %d" % (amount, point[amount])
+            lines.append(line)
+        return lines
+
+    def _ms(self, ms):
+        if ms is None:
+            return '-'
+        return '%.0f' % ms
+
+    #
+    # Write report as JSON.
+    #
+    # @param path string - file name
+    #
+    def dump(self, path):
+        with open(path, 'wb') as f:
+            json.dump(self.report(), f, indent=1, sort_keys=True)
+
+# shared by all screens, the poller and worker threads
+metrics = Metrics()
+
+#
+# Decorator recording the duration of each call of a method, also as
+# trace span at debug level.
+#
+# @param name string - measuring point
+#
+def timed(name):
+    def decorate(func):
+        def call(*args, **kwargs):
+            if not metrics.enabled and trace.threshold < trace.DEBUG:
+                return func(*args, **kwargs)
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.add(name, (time.time() - start) * 1000)
+                trace.span(trace.DEBUG, name, start)
+        call.__name__ = func.__name__
+        call.__doc__ = func.__doc__
+        return call
+    return decorate
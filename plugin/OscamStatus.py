@@ -1,20 +1,36 @@
 # -*- coding: utf-8 -*-
-import base64
 import ConfigParser
+import binascii
 import fileinput
 import json
 import os
 import re
 import requests
+import threading
+import time
 
 from enigma import eTimer, getDesktop, iServiceInformation
+from twisted.internet import reactor, threads
 from Components.ActionMap import ActionMap
 from Components.Label import Label
+from Components.ScrollLabel import ScrollLabel
 from Components.Sources.List import List
 from Screens.MessageBox import MessageBox
 from Screens.Screen import Screen
 
-from __init__ import _
+from __init__ import _, isDebug
+from EmmLog import EmmLogReader
+from Metrics import metrics, timed
+from Payload import PayloadClassifier, PayloadScanner
+from Poller import CardStatusPoller
+from Trace import trace
+from Watch import LogWatcher
+
+# hot path timing and trace buffer, see MetricsScreen.
+# Without debug mode only warnings go to the enigma2 log.
+metrics.setEnabled(isDebug())
+if isDebug():
+    trace.setLevel(trace.DEBUG, trace.DEBUG)
 
 class WebifException(Exception):
     pass
@@ -33,12 +49,16 @@ class OscamConfig:
     EMM_VAR_LOG   = 3
     EMM_NOCHANGE  = 4
     
+    # keep only this many EMMs seen last per reader, None: keep all
+    EMM_LIMIT = None
+    
     def __init__(self, confdir):
         self.confdir = confdir
         self.cp = ConfigParser.SafeConfigParser()
         self.webif = None
         self.emmlogdir = None
-        self.emmlogfileDate = 0
+        # per reader label: EmmLogReader, last EMM list and hint, formatted rows by slot
+        self.emmlogs = {}
         self._readOscamUser()
     
     def _readOscamUser(self):
@@ -67,65 +87,127 @@ class OscamConfig:
             return dict(self.webif)
         return None
     
-    def _formatDate(self, date):
-        m = re.match(r"(\d+)/(\d+)/(\d+) (.*)", date)
-        if m:
-            return m.group(3)+"."+m.group(2)+"."+m.group(1)+" "+m.group(4)
-        return date
+    #
+    # @param timestamp int - UTC timestamp from EmmLogReader
+    # @return string - formatted date, in the time zone of the log
+    #
+    def _formatDate(self, timestamp):
+        return time.strftime("%d.%m.%Y %H:%M:%S", time.gmtime(timestamp))
     
     #
     # Die Datei mit den gespeicherten Unique EMM einlesen, alle gespeicherten
     # EMMs mit letztem aufgetretenem Datum zurückliefern. Zur Darstellung
     # am TV die Serial und Data unkenntlich machen.
+    # Die Datei wird inkrementell gelesen: nur neu angehängte Zeilen werden
+    # geparst, bei Rotation oder Truncate wird neu eingelesen. Der Index
+    # wird im Config-Verzeichnis gespeichert und bleibt so auch erhalten,
+    # wenn Oscam das Log kürzt oder /var/log beim Reboot gelöscht wird.
+    #
+    # @param reader string - label of reader
+    # @param force bool - never answer EMM_NOCHANGE, e.g. for a new screen
+    # @return dict - emm: rows (first, last, masked EMM, binary EMM), hint
     #
-    def getSavedEmm(self, reader):
+    def getSavedEmm(self, reader, force=False):
 
-        logfile = self.emmlogdir + '/' + reader + '_unique_emm.log'
-        print "[OSS OscamConfig.getSavedEmm] versuche '%s' zu lesen" % logfile
+        state = self._getEmmState(reader)
+        emmlog = state['log']
+        trace.debug("OscamConfig.getSavedEmm", "versuche '%s' zu lesen", emmlog.logfile)
+        start = time.time()
+        linesRead = emmlog.linesRead
+        bytesRead = emmlog.bytesRead
 
-        seen = {}
-        ret = []
         hint = self.EMM_OK
         try:
-            stat = os.stat(logfile)
-            if self.emmlogfileDate >= stat.st_mtime:
+            if emmlog.update():
+                emmlog.save()
+            elif state['emm'] is not None:
+                trace.debug("OscamConfig.getSavedEmm", "keine neuen EMMs")
+                if force:
+                    metrics.add('emm getSavedEmm', (time.time() - start) * 1000)
+                    return { 'emm': state['emm'], 'hint': state['hint'] }
                 hint = self.EMM_NOCHANGE
-                print "[OSS OscamConfig.getSavedEmm] keine neuen EMMs"
-            else:
-                self.emmlogfileDate = stat.st_mtime
-        except OSError as e:
-            print "[OSS OscamConfig.getSavedEmm] I/O error: %s" % e.strerror
-
-        if hint == self.EMM_OK:
-            try:
-                with open(logfile, 'r') as log:
-                    for line in log:
-                        m = re.search(r"(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})\s+[0-9A-Z]{16}\s+([0-9A-F]+)\s+", line.rstrip())
-                        if m:
-                            date = m.group(1)
-                            key = m.group(2)
-                            try:
-                                if seen[key]['first'] > date:
-                                    seen[key]['first'] = date
-                                if seen[key]['last'] < date:
-                                    seen[key]['last'] = date
-                            except KeyError:
-                                seen[key] = {}
-                                seen[key]['first'] = date
-                                seen[key]['last'] = date
-            except IOError as e:
-                print "[OSS OscamConfig.getSavedEmm] I/O error: %s" % e.strerror
+        except (IOError, OSError) as e:
+            trace.warn("OscamConfig.getSavedEmm", "I/O error: %s", e.strerror)
+            emmlog.rewind()
+            # history from index is still shown
+            if not len(emmlog):
                 hint = self.EMM_NOT_FOUND
                 if self.emmlogdir[0:8] == '/var/log':
                     hint = self.EMM_VAR_LOG
 
-        if seen:
-            keys = sorted(seen, key=lambda x: seen[x]['last'], reverse=True)
-            for key in keys:
+        if hint != self.EMM_NOCHANGE:
+            # rows, by slot, are only formatted for EMMs seen since the last call
+            changed = emmlog.takeChanged()
+            if state['rows'] is None or state['generation'] != emmlog.generation:
+                state['rows'] = []
+                state['generation'] = emmlog.generation
+                changed = range(len(emmlog))
+            rows = state['rows']
+            rows.extend([None] * (len(emmlog) - len(rows)))
+            for slot in changed:
+                key = emmlog.hexKey(emmlog.keys[slot][0:15])
                 payload = key[0:6] + ' ' + key[6:8] + ' ######## ' + key[16:30] + ' ...'
-                ret.append( ( self._formatDate(seen[key]['first']), self._formatDate(seen[key]['last']), payload, key) )
-                
-        return { 'emm': ret, 'hint': hint }
+                rows[slot] = ( self._formatDate(emmlog.first[slot]), self._formatDate(emmlog.last[slot]), payload, emmlog.keys[slot])
+            slots = sorted(range(len(rows)), key=emmlog.last.__getitem__, reverse=True)
+            state['emm'] = [ rows[slot] for slot in slots ]
+            state['hint'] = hint
+
+            if isDebug():
+                trace.debug("OscamConfig.getSavedEmm", "memory: %s", emmlog.memoryReport())
+
+        metrics.add('emm getSavedEmm', (time.time() - start) * 1000,
+                    { 'lines': emmlog.linesRead - linesRead, 'bytes': emmlog.bytesRead - bytesRead })
+        trace.span(trace.INFO, "OscamConfig.getSavedEmm", start, "%d lines read, %d EMMs",
+                   emmlog.linesRead - linesRead, len(emmlog))
+        return { 'emm': state['emm'], 'hint': hint }
+    
+    #
+    # @param reader string - label of reader
+    # @return dict - EmmLogReader, last EMM list, hint and rows of reader
+    #
+    def _getEmmState(self, reader):
+        logfile = self.getEmmLogfile(reader)
+        state = self.emmlogs.get(reader)
+        if state is None or state['log'].logfile != logfile:
+            indexfile = self.confdir + '/' + reader + '_unique_emm.idx'
+            state = { 'log': EmmLogReader(logfile, indexfile, self.EMM_LIMIT),
+                      'emm': None, 'hint': None, 'rows': None, 'generation': None }
+            self.emmlogs[reader] = state
+        return state
+    
+    #
+    # @param reader string - label of reader
+    # @return string - path of the unique EMM log of reader
+    #
+    def getEmmLogfile(self, reader):
+        return self.emmlogdir + '/' + reader + '_unique_emm.log'
+    
+    #
+    # Read new lines of the unique EMM log into the index without building
+    # the EMM list, e.g. from the background poller. The next getSavedEmm
+    # builds the list again and doesn't answer EMM_NOCHANGE.
+    #
+    # @param reader string - label of reader
+    #
+    @timed('emm updateSavedEmm')
+    def updateSavedEmm(self, reader):
+        state = self._getEmmState(reader)
+        try:
+            if state['log'].update():
+                state['log'].save()
+                state['emm'] = None
+        except (IOError, OSError) as e:
+            trace.warn("OscamConfig.updateSavedEmm", "I/O error: %s", e.strerror)
+            state['log'].rewind()
+    
+    #
+    # Drop the EMM lists built for screens, e.g. when the screen is closed.
+    # The seen index is kept.
+    #
+    def releaseSavedEmm(self):
+        for state in self.emmlogs.itervalues():
+            state['emm'] = None
+            state['rows'] = None
     
     #
     # Blank out emmlogdir directive in oscam.conf.
@@ -143,28 +225,125 @@ class OscamConfig:
         file.close()
     
 
+class SharedDigestAuth(requests.auth.HTTPDigestAuth):
+    """Digest auth sharing the server nonce between threads.
+    
+    requests keeps challenge and nc per thread, so each new worker thread
+    would see a 401 challenge first. Here the last challenge is shared:
+    a thread starts with the nonce another thread got, nc is counted up
+    across all threads under a lock. A thread that gets a new challenge,
+    e.g. after the nonce went stale, replaces the shared one.
+    """
+    
+    def __init__(self, username, password):
+        requests.auth.HTTPDigestAuth.__init__(self, username, password)
+        self.sharedLock = threading.Lock()
+        self.sharedChal = {}
+        self.sharedNonce = ''
+        self.sharedCount = 0
+    
+    def init_per_thread_state(self):
+        requests.auth.HTTPDigestAuth.init_per_thread_state(self)
+        # a saved nonce makes requests send the Authorization header right away
+        with self.sharedLock:
+            if self.sharedNonce:
+                self._thread_local.chal = self._thread_local.adopted = self.sharedChal
+                self._thread_local.last_nonce = self.sharedNonce
+    
+    def build_digest_header(self, method, url):
+        local = self._thread_local
+        with self.sharedLock:
+            if local.chal and local.chal is not getattr(local, 'adopted', None):
+                # challenge just received by this thread
+                self.sharedChal = local.chal
+            local.chal = local.adopted = self.sharedChal
+            local.last_nonce = self.sharedNonce
+            local.nonce_count = self.sharedCount
+            header = requests.auth.HTTPDigestAuth.build_digest_header(self, method, url)
+            self.sharedNonce = local.last_nonce
+            self.sharedCount = local.nonce_count
+        return header
+
+
 class OscamWebif:
     """Methods to fetch information via Oscam web interface:
     - do we serve a supported card (V13, V14, Teleclub)?
     - what's the label of that card
     - get expire dates of entitlements
     - write an EMM
+    
+    All requests are blocking. Screens run them in a worker thread with
+    twisted.internet.threads.deferToThread, so results are delivered back
+    to the enigma2 main loop.
+    
+    Requests share one keep-alive session. The digest auth object keeps the
+    server nonce and counts nc up for all threads, so only the first
+    request (or a request after the nonce went stale) sees a 401 challenge.
     """
+    
+    SKY_CAIDS = ['09C4', '098C', '09B6']
+    
+    # max. parallel entitlement requests when looking for the Sky reader
+    FANOUT = 3
+    
+    # s to connect and to wait for a response, so a hung Oscam doesn't
+    # block worker threads forever; overall deadline of a fan-out
+    CONNECT_TIMEOUT = 5
+    READ_TIMEOUT = 15
+    FANOUT_TIMEOUT = 40
+    
+    # s entitlements of a reader are cached by getTiers
+    TIERS_TTL = 60
+    
+    # EMM batch: ms between writing an EMM and reading the tiers again
+    EMM_PAUSE = 2000
+    
+    # payload read out: live log poll interval and default deadline in ms
+    PAYLOAD_POLL = 1000
+    PAYLOAD_TIMEOUT = 15000
+    
+    LASTID = re.compile(r'"lastid"\s*:\s*"?(\d+)')
+    
+    # API part of a request, to tell endpoints apart in metrics
+    PART = re.compile(r'[?&]part=(\w+)')
+    
+    # start of a reader entry in the status document, and of any entry.
+    # Oscam writes "type" as first key of each entry.
+    STATUS_READER = re.compile(r'\{\s*"type"\s*:\s*"r"')
+    STATUS_ENTRY = re.compile(r'\{\s*"type"\s*:')
+    
     def __init__(self, host, port, user=None, password=None):
         self.webif = 'http://'+host+':'+port
         self.user = user
         self.password = password
         
+        self.session = requests.Session()
+        if user:
+            self.session.auth = SharedDigestAuth(user, password)
+        
+        self.statsLock = threading.Lock()
+        self.requestCount = 0
+        self.roundTrips = 0
+        
+        self.tiersLock = threading.Lock()
+        self.tiersCache = {}
+        self.tiersPending = {}
+        self.tiersGeneration = {}
+        
         self.timer = eTimer()
         self.timer.callback.append(self.extractPayload)
         
         self.callback = None
+        self.payloadActive = False
+        self.payloadScanner = None
+        self.payloadDeadline = 0
+        self.logpollId = None
         
         if password:
             password = '########'
         if user:
             user = '########'
-        print "[OSS OscamWebif.__init__] OscamWebif(%s, %s, %s, %s)" % (host, port, user, password)
+        trace.info("OscamWebif.__init__", "OscamWebif(%s, %s, %s, %s)", host, port, user, password)
 
     #
     # GET request for web interface url.
@@ -173,19 +352,46 @@ class OscamWebif:
     # @return string - contents of url
     #
     def _get(self, url):
+        start = time.time()
         try:
-            if self.user:
-                r = requests.get(url, auth=requests.auth.HTTPDigestAuth(self.user, self.password))
-            else:
-                r = requests.get(url)
-            print "[OSS OscamWebif._get] URL: %s => %s" % (url, r.status_code)
+            r = self.session.get(url, timeout=(self.CONNECT_TIMEOUT, self.READ_TIMEOUT))
+            # digest challenges show up as 401 responses in history
+            with self.statsLock:
+                self.requestCount += 1
+                self.roundTrips += 1 + len(r.history)
+            trace.span(trace.INFO, "OscamWebif._get", start, "URL: %s => %s (%d round trips)", url, r.status_code, 1 + len(r.history))
             if r.status_code != 200:
                 raise WebifException(r.status_code)
         except Exception as e:
-            print "[OSS OscamWebif._get] catch exception", e
+            trace.warn("OscamWebif._get", "catch exception %s", e)
+            if metrics.enabled:
+                metrics.add(self._endpoint(url) + ' failed', (time.time() - start) * 1000)
             raise WebifException(521)
+        if metrics.enabled:
+            metrics.add(self._endpoint(url), (time.time() - start) * 1000,
+                        { 'bytes': len(r.content), 'roundtrips': 1 + len(r.history) })
         return r.text
     
+    #
+    # @param url string - url of web interface request
+    # @return string - measuring point for metrics, e.g. "webif oscamapi.json status"
+    #
+    def _endpoint(self, url):
+        name = 'webif ' + url[len(self.webif) + 1:].split('?')[0]
+        m = self.PART.search(url)
+        if m:
+            name += ' ' + m.group(1)
+        return name
+    
+    #
+    # Request statistics for this object.
+    #
+    # @return dict - logical requests and HTTP round trips so far
+    #
+    def getRequestStats(self):
+        with self.statsLock:
+            return { 'requests': self.requestCount, 'roundtrips': self.roundTrips }
+    
     #
     # Read status page from Oscam JSON API
     # @return string - json text with status information
@@ -207,34 +413,175 @@ class OscamWebif:
     #
     # Use Oscam JSON API to find out, if we have a local V13/V14 or 
     # Teleclub card running. We return reader and CAID of that card.
+    # The first Sky reader in order of the status page is returned. CARDOK
+    # readers before the first one reporting a Sky CAID in the status are
+    # checked concurrently via their entitlements.
     #
     # @return None|dict
     #
     def getStatusSky(self):
+        # candidates are the readers before the first one reporting a Sky CAID
+        found, candidates, order = self._getSkyCandidates(True)
+        found = self._findSkyReaders(candidates, True) + found
+        if found:
+            return found[0]
+        return None
+    
+    #
+    # Like getStatusSky, but return all local V13/V14 and Teleclub cards,
+    # e.g. for a V13 and a V14 running in parallel. Entitlements of the
+    # CARDOK readers without Sky CAID in the status are checked concurrently.
+    #
+    # @return list - dicts with reader and caid, in order of the status page
+    #
+    def getStatusSkyAll(self):
+        found, candidates, order = self._getSkyCandidates()
+        found += self._findSkyReaders(candidates)
+        found.sort(key=lambda status: order.index(status['reader']))
+        return found
+    
+    #
+    # @param first bool - stop at the first reader reporting a Sky CAID
+    # @return tuple - list of readers reporting a Sky CAID (dicts with
+    #                 reader and caid), list of labels of other CARDOK readers,
+    #                 labels of all CARDOK readers in order of the status page
+    #
+    def _getSkyCandidates(self, first=False):
+        found = []
+        candidates = []
+        order = []
         status = self.getStatus()
-        reader = None
-        caid = None
         if status:
-            obj = json.loads(status)
-            clients = obj['oscam']['status']['client']
-            for client in clients:
+            for client in self._parseReaders(status):
                 conn = client['connection']
                 if conn['$'] == 'CARDOK':
+                    order.append(client['rname_enc'])
                     for ent in conn['entitlements']:
-                        if ent['caid'] in ['09C4', '098C', '09B6']:
-                            reader = client['rname_enc']
-                            caid = ent['caid']
+                        if ent['caid'] in self.SKY_CAIDS:
+                            found.append({ 'reader': client['rname_enc'], 'caid': ent['caid'] })
                             break
                     else:
-                        ent = self.getTiers(client['rname_enc'])
-                        if ent['caid'] in ['09C4', '098C', '09B6']:
-                            reader = client['rname_enc']
-                            caid = ent['caid']
+                        candidates.append(client['rname_enc'])
+                    if first and found:
+                        break
+        return found, candidates, order
+    
+    #
+    # Parse only the reader entries of the status document. With hundreds
+    # of user clients connected, most of the document is skipped: reader
+    # entries are located by their "type" key and decoded one by one.
+    # If the entries don't start with "type", the whole document is parsed.
+    #
+    # @param status string - json text from status API
+    # @return generator - dicts of reader entries, in document order
+    #
+    def _parseReaders(self, status):
+        decoder = json.JSONDecoder()
+        matched = False
+        for m in self.STATUS_READER.finditer(status):
+            matched = True
+            yield decoder.raw_decode(status, m.start())[0]
+        if matched or self.STATUS_ENTRY.search(status):
+            return
+
+        trace.info("OscamWebif._parseReaders", "unknown layout, parse whole status")
+        for client in json.loads(status)['oscam']['status']['client']:
+            if client.get('type', 'r') == 'r':
+                yield client
+    
+    #
+    # Check entitlements of readers for a Sky CAID.
+    #
+    # @param readers list - labels of readers to check
+    # @param first bool - return as soon as the first Sky reader in order
+    #                     of readers is known: it is a Sky reader and all
+    #                     readers before it are checked
+    # @return list - dicts with reader and caid, in order of readers
+    #
+    def _findSkyReaders(self, readers, first=False):
+        isSky = lambda ent: ent['caid'] in self.SKY_CAIDS
+        def settled(finished):
+            for reader in readers:
+                if reader not in finished:
+                    return False
+                if finished[reader] is not None and isSky(finished[reader]):
+                    return True
+            return True
+        results = self._fanOut(self.getTiers, readers, settled if first else None)
+        return [ { 'reader': reader, 'caid': results[reader]['caid'] }
+                 for reader in readers if reader in results and isSky(results[reader]) ]
+    
+    #
+    # Read tiers of several readers concurrently.
+    #
+    # @param readers list - labels of readers
+    # @return dict - reader label -> result of getTiers, failed readers are missing
+    #
+    def getTiersAll(self, readers):
+        return self._fanOut(self.getTiers, readers)
+    
+    #
+    # Call func for several readers in parallel, at most FANOUT calls at
+    # a time. If stop is given, return as soon as stop is true for the
+    # calls finished so far; calls still running are left to finish in the
+    # background.
+    # The same after FANOUT_TIMEOUT s, readers not done by then are missing.
+    #
+    # @param func function - called with reader label
+    # @param readers list - labels of readers
+    # @param stop function|None - called after each call with a dict of the
+    #                            calls finished so far: reader label ->
+    #                            result, None if the call failed
+    # @return dict - reader label -> result, readers whose call raised
+    #                WebifException are missing
+    #
+    def _fanOut(self, func, readers, stop=None):
+        results = {}
+        if not readers:
+            return results
+        
+        pending = list(readers)
+        finished = {}
+        state = { 'workers': min(self.FANOUT, len(pending)) }
+        lock = threading.Lock()
+        done = threading.Event()
+        
+        def worker():
+            try:
+                while not done.is_set():
+                    with lock:
+                        if not pending:
+                            break
+                        reader = pending.pop(0)
+                    try:
+                        result = func(reader)
+                    except WebifException as e:
+                        trace.warn("OscamWebif._fanOut", "catch exception %s", e)
+                        result = None
+                    with lock:
+                        if done.is_set():
                             break
-            if reader and caid:
-                return { 'reader': reader, 'caid': caid }
+                        finished[reader] = result
+                        if result is not None:
+                            results[reader] = result
+                        if stop and stop(finished):
+                            done.set()
+            finally:
+                with lock:
+                    state['workers'] -= 1
+                    if state['workers'] == 0:
+                        done.set()
         
-        return None
+        for i in range(state['workers']):
+            t = threading.Thread(target=worker)
+            t.daemon = True
+            t.start()
+        if not done.wait(self.FANOUT_TIMEOUT):
+            trace.warn("OscamWebif._fanOut", "no answer within %d s, %d readers left", self.FANOUT_TIMEOUT, len(pending))
+        
+        with lock:
+            done.set()
+            return dict(results)
     
     #
     # Write EMM via web interface form.
@@ -244,73 +591,234 @@ class OscamWebif:
     # @param emm strig - emm to write to card
     # @param callback function - where to return to after writing
     #
-    def writeEmm(self, reader, caid, emm, callback):
+    def writeEmm(self, reader, caid, emm, callback=None):
         url = self.webif+'/emm_running.html?label=%s&emmfile=&emmcaid=%s&ep=%s&action=Launch' % (reader,caid,emm)
-        self._get(url)
-        callback()
+        try:
+            self._get(url)
+        finally:
+            self.invalidateTiers(reader)
+        if callback:
+            callback()
 
     #
-    # Read payload from one line of live log data.
+    # Write several EMMs one after another. After each EMM wait EMM_PAUSE ms,
+    # read the tiers again and stop as soon as the expire date has moved
+    # forward. Blocking, screens run it in a worker thread.
     #
-    # @return string|None - payload if pattern matches.
+    # @param reader string - label of affected reader
+    # @param caid string - caid of affected reader
+    # @param emms list - emms to write, in this order
+    # @param progress function|None - called from the worker thread with
+    #                                 number of EMMs written and total
+    # @param cancel threading.Event|None - stop before the next EMM when set
+    # @return dict - EMMs written, the EMM that extended the card or None,
+    #                expire date before and tiers after the last EMM
+    #
+    def writeEmms(self, reader, caid, emms, progress=None, cancel=None):
+        before = self.getTiers(reader, True)
+        result = { 'written': 0, 'emm': None, 'before': before['expires'], 'tiers': before }
+        for emm in emms:
+            if cancel and cancel.is_set():
+                break
+            self.writeEmm(reader, caid, emm)
+            result['written'] += 1
+            if progress:
+                progress(result['written'], len(emms))
+
+            if cancel:
+                cancel.wait(self.EMM_PAUSE / 1000.0)
+            else:
+                time.sleep(self.EMM_PAUSE / 1000.0)
+            result['tiers'] = self.getTiers(reader, True)
+
+            old = self._expireKey(before['expires'])
+            new = self._expireKey(result['tiers']['expires'])
+            if old and new and new > old:
+                trace.info("OscamWebif.writeEmms", "%s extended with EMM %d: %s", reader, result['written'], emm)
+                result['emm'] = emm
+                break
+        return result
+
     #
-    def getPayloadFromLine(self,line):
-        m = re.search('(0F 0[46] .. .. .. .. .. ..)', line)
+    # @param expires string|None - expire date as formatted by _formatDate
+    # @return tuple - year, month, day for comparing, empty if unknown
+    #
+    def _expireKey(self, expires):
+        m = re.match(r"(\d+)\. (\d+)\. (\d+)$", expires or '')
         if m:
-            return m.group(1)
-        return None
-    
+            return (int(m.group(3)), int(m.group(2)), int(m.group(1)))
+        return ()
+
+    #
+    # Read payload from live log.
+    # Switch to debug level 4 in a worker thread, then poll the live log
+    # every PAYLOAD_POLL ms for new lines until a payload shows up or the
+    # deadline has passed. Switch back to debug level 0 afterwards.
+    #
+    # @param callback function - called with payload or None when finished.
+    # @param timeout int - overall deadline in ms
+    #
+    def fetchPayload(self, callback, timeout=None):
+        self.callback = callback
+        self.payloadDeadline = time.time() + (timeout or self.PAYLOAD_TIMEOUT) / 1000.0
+        self.payloadScanner = PayloadScanner()
+        self.logpollId = None
+        self.payloadActive = True
+        url = self.webif+'/logpoll.html?debug=4'
+        d = threads.deferToThread(self._get, url)
+        d.addCallbacks(self._startPayloadPoll, self._errbackPayload)
+
+    #
+    # Stop a running payload read out without calling back.
+    #
+    def stopPayload(self):
+        self.timer.stop()
+        self.callback = None
+        if self.payloadActive:
+            self._finishPayload(None)
+
+    def _startPayloadPoll(self, logpoll):
+        if not self.payloadActive:
+            # stopped while switching to debug level 4, which may have
+            # landed after switching back: switch back again
+            self._setDebugLevel(0)
+            return
+        # only lines logged after switching to debug level 4 are of interest
+        try:
+            self.logpollId = json.loads(logpoll)['oscam']['lastid']
+        except Exception as e:
+            trace.info("OscamWebif.fetchPayload", "no lastid in logpoll %s", e)
+        self.timer.start(self.PAYLOAD_POLL, True)
+
     #
-    # Read last payload from 10 seconds live log.
-    # Call callback function after read out.
+    # Timer callback: read new live log lines in a worker thread.
     #
     def extractPayload(self):
-        url = self.webif+'/logpoll.html?debug=0'
+        d = threads.deferToThread(self.pollPayload)
+        d.addCallbacks(self._callbackPayload, self._errbackPayload)
+
+    def _callbackPayload(self, payload):
+        if not self.payloadActive:
+            return
+        if payload or time.time() >= self.payloadDeadline:
+            self._finishPayload(payload)
+        else:
+            self.timer.start(self.PAYLOAD_POLL, True)
+
+    def _errbackPayload(self, failure):
+        trace.warn("OscamWebif.fetchPayload", "catch exception %s", failure.getErrorMessage())
+        if self.payloadActive:
+            self._finishPayload(None)
+
+    def _finishPayload(self, payload):
+        self.payloadActive = False
+        self._setDebugLevel(0)
+        if self.callback:
+            self.callback(payload)
+
+    #
+    # Set Oscam debug level in a worker thread, errors are ignored.
+    #
+    # @param level int - debug level
+    #
+    def _setDebugLevel(self, level):
+        url = self.webif+'/logpoll.html?debug=%d' % level
+        d = threads.deferToThread(self._get, url)
+        d.addErrback(lambda failure: None)
+
+    #
+    # Read live log lines logged since the last poll and look for a payload.
+    # If Oscam doesn't report line ids, the whole live log is searched.
+    #
+    # @return string|None - last payload found
+    #
+    def pollPayload(self):
+        url = self.webif+'/logpoll.html'
+        if self.logpollId is not None:
+            url += '?lastid=%s' % self.logpollId
+        else:
+            self.payloadScanner = PayloadScanner()
         logpoll = self._get(url)
         payload = None
         try:
+            # no payload in this window: only the lastid is needed
+            if not self.payloadScanner.isPending() and not self.payloadScanner.hasMarker(logpoll):
+                m = self.LASTID.search(logpoll)
+                if m:
+                    if self.logpollId is not None:
+                        self.logpollId = m.group(1)
+                    return None
             obj = json.loads(logpoll)
-            lines = obj['oscam']['lines']
-
-            foundPayloadHeader = False
-            lookAhead = 2
-            for line in lines:
-                decoded = base64.b64decode(line['line'])
-                if foundPayloadHeader:
-                    lookAhead -= 1
-                    if lookAhead == 0:
-                        payload = self.getPayloadFromLine(decoded)
-                        foundPayloadHeader = False
-                        continue
-                if 'Decrypted payload' in decoded:
-                    lookAhead = 2
-                    foundPayloadHeader = True
+            if self.logpollId is not None and 'lastid' in obj['oscam']:
+                self.logpollId = obj['oscam']['lastid']
+            payloads = self.payloadScanner.scanLines(obj['oscam']['lines'])
+            if payloads:
+                payload = payloads[-1]
         except Exception as e:
-            print "[OSS OscamWebif.extractPayload] catch exception", e
+            trace.warn("OscamWebif.pollPayload", "catch exception %s", e)
         
-        if self.callback:
-            self.callback(payload)
+        return payload
 
     #
-    # Read payload from live log.
-    # Switch to debug level 4, set a timer, finish read out in timer callback.
+    # Search a logpoll.html document for payloads.
     #
-    # @param callback function - where to return after finishing timer callback.
+    # @param logpoll string - json text from logpoll.html
+    # @param scanner PayloadScanner|None - scanner holding state of earlier polls
+    # @return list - all payloads found, in order of appearance
     #
-    def fetchPayload(self, callback):
-        url = self.webif+'/logpoll.html?debug=4'
-        self._get(url)
-        self.callback = callback
-        self.timer.start(10000, True)
+    def extractPayloads(self, logpoll, scanner=None):
+        scanner = scanner or PayloadScanner()
+        if not scanner.isPending() and not scanner.hasMarker(logpoll):
+            return []
+        obj = json.loads(logpoll)
+        return scanner.scanLines(obj['oscam']['lines'])
     
     #
     # Read tier ID's
+    # Results are cached per reader for TIERS_TTL seconds. Concurrent calls
+    # for the same reader share one request.
     #
     # @param reader string - label of reader
+    # @param fresh bool - bypass cache
+    #
+    def getTiers(self, reader, fresh=False):
+        with self.tiersLock:
+            generation = self.tiersGeneration.get(reader, 0)
+            cached = self.tiersCache.get(reader)
+            if cached and not fresh and time.time() - cached['time'] < self.TIERS_TTL:
+                return cached['tiers']
+            pending = self.tiersPending.get(reader)
+            owner = pending is None or pending['generation'] != generation
+            if owner:
+                pending = { 'event': threading.Event(), 'generation': generation, 'tiers': None, 'error': None }
+                self.tiersPending[reader] = pending
+
+        if not owner:
+            pending['event'].wait()
+            if pending['error']:
+                raise pending['error']
+            return pending['tiers']
+
+        try:
+            url = self.webif+'/oscamapi.json?part=entitlement&label=%s' % reader
+            pending['tiers'] = self._parseTiers(self._get(url))
+        except WebifException as e:
+            pending['error'] = e
+            raise
+        finally:
+            with self.tiersLock:
+                if pending['tiers'] and self.tiersGeneration.get(reader, 0) == generation:
+                    self.tiersCache[reader] = { 'time': time.time(), 'tiers': pending['tiers'] }
+                if self.tiersPending.get(reader) is pending:
+                    del self.tiersPending[reader]
+            pending['event'].set()
+        return pending['tiers']
+
     #
-    def getTiers(self, reader):
-        url = self.webif+'/oscamapi.json?part=entitlement&label=%s' % reader
-        entitlements = self._get(url)
+    # @param entitlements string - json text from entitlement API
+    # @return dict - tier IDs, expire date and caid
+    #
+    def _parseTiers(self, entitlements):
         tiers = []
         expires = None
         caid = None
@@ -325,6 +833,19 @@ class OscamWebif:
             pass
         return { 'tiers': tiers, 'expires': expires, 'caid': caid }
 
+    #
+    # Drop cached tiers, e.g. after writing an EMM.
+    # Requests already running for that reader won't fill the cache.
+    #
+    # @param reader string|None - label of reader, None for all readers
+    #
+    def invalidateTiers(self, reader=None):
+        with self.tiersLock:
+            readers = [reader] if reader else self.tiersCache.keys() + self.tiersPending.keys()
+            for r in readers:
+                self.tiersGeneration[r] = self.tiersGeneration.get(r, 0) + 1
+                self.tiersCache.pop(r, None)
+
 
 class CardStatus:
     """Class that holds gathered information from running Oscam instance.
@@ -332,6 +853,11 @@ class CardStatus:
     Is inherited from class OscamStatus.
     """
     
+    # Oscam process and config snapshot (oscam.version and oscam.conf
+    # information, OscamConfig and OscamWebif objects) found by the last
+    # instance, so reopening the screen can skip discovery and config parsing.
+    discovery = { 'pid': None, 'cmdline': None, 'tempdir': None, 'snapshot': None }
+    
     def __init__(self, session):
         self.session = session
         
@@ -347,6 +873,9 @@ class CardStatus:
         self.list = None
         self.webif = None
         self.oscamConfig = None
+        # state of all Sky readers, status etc. above mirror the selected one
+        self.readers = []
+        self.readerIndex = 0
         
         self.getOscamInformation()
 
@@ -359,74 +888,119 @@ class CardStatus:
     # set self.oscamWebifSupport bool - is webif support compiled into Oscam
     # set self.oscamLivelogSupport - is live log support compiled into Oscam
     #
+    @timed('discovery readOscamVersion')
     def readOscamVersion(self, tempdir):
         try:
             for line in open(os.path.join(tempdir, 'oscam.version'), 'rb'):
                 if 'ConfigDir:' in line:
                     self.oscamConfdir = line.split(":")[1].strip()
-                    print "[OSS CardStatus.readOscamVersion] confdir:", self.oscamConfdir
+                    trace.info("CardStatus.readOscamVersion", "confdir: %s", self.oscamConfdir)
                     
                 if 'Web interface support:' in line:
                     self.oscamWebifSupport = line.split(":")[1].strip() == 'yes'
-                    print "[OSS CardStatus.readOscamVersion] webif support:", self.oscamWebifSupport
+                    trace.info("CardStatus.readOscamVersion", "webif support: %s", self.oscamWebifSupport)
                     
                 if 'LiveLog support:' in line:
                     self.oscamLivelogSupport = line.split(":")[1].strip() == 'yes'
-                    print "[OSS CardStatus.readOscamVersion] livelog support:", self.oscamLivelogSupport
+                    trace.info("CardStatus.readOscamVersion", "livelog support: %s", self.oscamLivelogSupport)
                 
                 if 'WebifPort:' in line:
                     self.oscamWebifPort = line.split(":")[1].strip()
-                    print "[OSS CardStatus.readOscamVersion] webif port:", self.oscamWebifPort
+                    trace.info("CardStatus.readOscamVersion", "webif port: %s", self.oscamWebifPort)
             
             #
             # Konfiguration ohne Webinterface
             if self.oscamWebifPort == "0":
                 self.oscamWebifSupport = False
-                print "[OSS CardStatus.readOscamVersion] webif not enabled"
+                trace.info("CardStatus.readOscamVersion", "webif not enabled")
                 
         except Exception as e:
-            print "[OSS CardStatus.readOscamVersion] kann", tempdir, "nicht öffnen:", e
+            trace.warn("CardStatus.readOscamVersion", "kann %s nicht öffnen: %s", tempdir, e)
     
     #
     # Find Oscam temp dir from running Oscam process.
     # Check if process was startet with param -t or --temp-dir
     #
+    # Try the process found last time first, then only look at processes
+    # whose name contains "oscam", and only then scan all processes.
+    #
     # @return string - temp dir where oscam.version lives.
     #
+    @timed('discovery getOscamTempdir')
     def getOscamTempdir(self):
-        tempdir = None
+        cache = CardStatus.discovery
+        if cache['pid']:
+            cmdline = self._readProc(cache['pid'], 'cmdline')
+            if cmdline is not None and cmdline == cache['cmdline']:
+                trace.debug("CardStatus.getOscamTempdir", "cached pid %s", cache['pid'])
+                return cache['tempdir']
+            cache['pid'] = None
 
         pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
+        found = self._findOscamProcess(pids, True) or self._findOscamProcess(pids, False)
+        if found:
+            cache['pid'], cache['cmdline'], cache['tempdir'] = found
+            return cache['tempdir']
+        return None
+
+    #
+    # @param pid string - process id
+    # @param name string - file name in /proc/<pid>
+    # @return string|None - file contents, None if process has terminated
+    #
+    def _readProc(self, pid, name):
+        try:
+            with open(os.path.join('/proc', pid, name), 'rb') as f:
+                return f.read()
+        except IOError: # proc has terminated
+            return None
+
+    #
+    # Look for a running Oscam process.
+    #
+    # @param pids list - process ids to check
+    # @param byName bool - only check processes with "oscam" in their name
+    # @return tuple|None - pid, cmdline and temp dir of Oscam process
+    #
+    def _findOscamProcess(self, pids, byName):
         for pid in pids:
-            try:
-                cmdline = open(os.path.join('/proc', pid, 'cmdline'), 'rb').read()
-                cmdpart = cmdline.lower().split('\0')
-                # @tested
-                if '/oscam' in cmdpart[0] or cmdpart[0][0:5] == 'oscam':
-                    nextIsTempDir = False
-                    for part in cmdpart:
-                        # @tested
-                        if '--temp-dir' in part:
-                            tempdir = part[11:]
-                            break
-                        # @tested
-                        if part == '-t':
-                            nextIsTempDir = True
-                            continue
-                        if nextIsTempDir:
-                            tempdir = part.rstrip('/')
-                            nextIsTempDir = False
-                    break
-            except IOError: # proc has terminated
+            if byName:
+                comm = self._readProc(pid, 'comm')
+                if comm is None or 'oscam' not in comm.lower():
+                    continue
+            cmdline = self._readProc(pid, 'cmdline')
+            if cmdline is None:
                 continue
-        
-        return tempdir
+            cmdpart = cmdline.split('\0')
+            program = cmdpart[0].lower()
+            # @tested
+            if '/oscam' in program or program[0:5] == 'oscam':
+                tempdir = None
+                nextIsTempDir = False
+                for part in cmdpart:
+                    # @tested
+                    if '--temp-dir' in part.lower():
+                        tempdir = part[11:]
+                        break
+                    # @tested
+                    if part == '-t':
+                        nextIsTempDir = True
+                        continue
+                    if nextIsTempDir:
+                        tempdir = part.rstrip('/')
+                        nextIsTempDir = False
+                return (pid, cmdline, tempdir)
+        return None
     
     #
     # Find out where oscam.conf lives.
     # First try to to read out /tmp/.oscam/oscam.version
     # If that does not exist, try to find it from running Oscam
     #
+    # The result is kept in the config snapshot as long as mtime and size
+    # of oscam.version are unchanged and the config dir still exists.
+    #
+    @timed('discovery getOscamInformation')
     def getOscamInformation(self):
         tempdir = '/tmp/.oscam'
         
@@ -436,7 +1010,42 @@ class CardStatus:
         
         # @tested
         if tempdir and os.path.exists(tempdir):
+            version = self._fileSignature(os.path.join(tempdir, 'oscam.version'))
+            snapshot = CardStatus.discovery['snapshot']
+            if snapshot and snapshot['tempdir'] == tempdir and snapshot['version'] == version \
+                    and snapshot['confdir'] and os.path.isdir(snapshot['confdir']):
+                trace.debug("CardStatus.getOscamInformation", "cached confdir: %s", snapshot['confdir'])
+                self.oscamConfdir = snapshot['confdir']
+                self.oscamWebifSupport = snapshot['webifSupport']
+                self.oscamLivelogSupport = snapshot['livelogSupport']
+                self.oscamWebifPort = snapshot['webifPort']
+                return
+
             self.readOscamVersion(tempdir)
+            CardStatus.discovery['snapshot'] = {
+                'tempdir': tempdir,
+                'version': version,
+                'confdir': self.oscamConfdir,
+                'webifSupport': self.oscamWebifSupport,
+                'livelogSupport': self.oscamLivelogSupport,
+                'webifPort': self.oscamWebifPort,
+                # filled in by setupWebif
+                'conf': None,
+                'oscamConfig': None,
+                'webif': None,
+                'localhostAccess': None,
+            }
+    
+    #
+    # @param path string - file name
+    # @return tuple|None - mtime and size of file, None if missing
+    #
+    def _fileSignature(self, path):
+        try:
+            stat = os.stat(path)
+            return (stat.st_mtime, stat.st_size)
+        except OSError:
+            return None
     
     #
     # Get an OscamWebif object for communication via Web interface.
@@ -461,7 +1070,7 @@ class CardStatus:
                 self.localhostAccess = True
                 try:
                     httpallowed = user['httpallowed']
-                    print "[OSS CardStatus.getOscamWebif] httpallowed:", httpallowed
+                    trace.info("CardStatus.getOscamWebif", "httpallowed: %s", httpallowed)
                     if '127.0.0.' not in httpallowed and '::1' not in httpallowed:
                         self.localhostAccess = False
                 except:
@@ -474,7 +1083,7 @@ class CardStatus:
             return OscamWebif(user['hostname'], user['httpport'], httpuser, httppwd)
                     
         else:
-            print "[OSS CardStatus.getOscamWebif] no webif support"
+            trace.warn("CardStatus.getOscamWebif", "no webif support")
             raise WebifException(501)
     
     #
@@ -487,43 +1096,161 @@ class CardStatus:
     # set self.status - reader and caid for Sky from webif
     #
     def getCardStatus(self):
-        #
-        # Jetzt aus der oscam.conf die Webif-Config auslesen
-        #
-        if self.oscamConfdir:
+        if self.setupWebif():
             # Über die Oscam-Webapi V13/V14-Reader suchen
-            self.oscamConfig = OscamConfig(self.oscamConfdir)
-            self.webif = self.getOscamWebif()
             try:
                 self.status = self.webif.getStatusSky()
             except WebifException as e:
-                print "[OSS CardStatus.getCardStatus] catch exception", e
+                trace.warn("CardStatus.getCardStatus", "catch exception %s", e)
 
             if self.status:
                 # gespeicherte unique EMMs anzeigen
-                self.getSavedEmm()
+                self.getSavedEmm(True)
                 
                 # Tier-IDs und Expire-Datum der Karte auslesen
                 try:
-                    tiers = self.webif.getTiers(self.status['reader'])
-                    self.tiers = tiers['tiers']
-                    self.expires = tiers['expires']
+                    self.setTiers(self.webif.getTiers(self.status['reader']))
                 except WebifException as e:
-                    print "[OSS CardStatus.getCardStatus] catch exception", e
+                    trace.warn("CardStatus.getCardStatus", "catch exception %s", e)
+
+    #
+    # Like getCardStatus, but for all Sky readers. Tiers of all readers
+    # are read concurrently. The first reader is selected afterwards.
+    #
+    # set self.readers - list of reader states, see setReaders
+    #
+    def getCardStatusAll(self):
+        if self.setupWebif():
+            statuses = []
+            try:
+                statuses = self.webif.getStatusSkyAll()
+            except WebifException as e:
+                trace.warn("CardStatus.getCardStatusAll", "catch exception %s", e)
+            self.setReaders(statuses)
+
+            for index in range(len(self.readers)):
+                self.selectReader(index)
+                self.getSavedEmm(True)
+
+            tiers = self.webif.getTiersAll([state['status']['reader'] for state in self.readers])
+            for index in range(len(self.readers)):
+                reader = self.readers[index]['status']['reader']
+                if reader in tiers:
+                    self.setReaderTiers(index, tiers[reader])
+
+            if self.readers:
+                self.selectReader(0)
+
+    #
+    # Start over with a new list of Sky readers and select the first one.
+    #
+    # @param statuses list - results of OscamWebif.getStatusSkyAll
+    #
+    def setReaders(self, statuses):
+        self.readers = []
+        for status in statuses:
+            self.readers.append({ 'status': status, 'tiers': None, 'expires': None, 'list': None, 'hint': None })
+        self.readerIndex = 0
+        self.status = None
+        self.tiers = None
+        self.expires = None
+        self.list = None
+        self.hint = None
+        if self.readers:
+            self.selectReader(0)
+
+    #
+    # Make a reader the selected one. Its state is copied to self.status,
+    # self.tiers, self.expires, self.list and self.hint; the state of the
+    # reader selected so far is kept for switching back.
+    #
+    # @param index int - index into self.readers
+    #
+    def selectReader(self, index):
+        current = self.readers[self.readerIndex]
+        if current['status'] is self.status:
+            current['tiers'] = self.tiers
+            current['expires'] = self.expires
+            current['list'] = self.list
+            current['hint'] = self.hint
+
+        self.readerIndex = index % len(self.readers)
+        state = self.readers[self.readerIndex]
+        self.status = state['status']
+        self.tiers = state['tiers']
+        self.expires = state['expires']
+        self.list = state['list']
+        self.hint = state['hint']
+
+    #
+    # Take over a getTiers result for any reader, not only the selected one.
+    #
+    # @param index int - index into self.readers
+    # @param tiers dict - result of OscamWebif.getTiers
+    #
+    def setReaderTiers(self, index, tiers):
+        if index == self.readerIndex:
+            self.setTiers(tiers)
         else:
-            print "[OSS CardStatus.getCardStatus] no oscam conf dir found"
+            self.readers[index]['tiers'] = tiers['tiers']
+            self.readers[index]['expires'] = tiers['expires']
+
+    #
+    # Read webif config from oscam.conf and create OscamWebif object.
+    # Does not talk to the web interface yet. Both objects are taken from
+    # the config snapshot while oscam.conf has the same mtime and size.
+    #
+    # set self.oscamConfig - @class OscamConfig
+    # set self.webif - @class OscamWebif
+    # @return bool - True if Oscam config dir is known
+    # @raise WebifException - if Oscam has no webif support
+    #
+    @timed('discovery setupWebif')
+    def setupWebif(self):
+        #
+        # Jetzt aus der oscam.conf die Webif-Config auslesen
+        #
+        if self.oscamConfdir:
+            conf = self._fileSignature(os.path.join(self.oscamConfdir, 'oscam.conf'))
+            snapshot = CardStatus.discovery['snapshot']
+            if snapshot and snapshot['confdir'] == self.oscamConfdir and snapshot['webif'] \
+                    and snapshot['conf'] == conf:
+                trace.debug("CardStatus.setupWebif", "cached webif config")
+                self.oscamConfig = snapshot['oscamConfig']
+                self.webif = snapshot['webif']
+                self.localhostAccess = snapshot['localhostAccess']
+                return True
+
+            self.oscamConfig = OscamConfig(self.oscamConfdir)
+            self.webif = self.getOscamWebif()
+            if snapshot and snapshot['confdir'] == self.oscamConfdir:
+                snapshot['conf'] = conf
+                snapshot['oscamConfig'] = self.oscamConfig
+                snapshot['webif'] = self.webif
+                snapshot['localhostAccess'] = self.localhostAccess
+            return True
+        trace.warn("CardStatus.setupWebif", "no oscam conf dir found")
+        return False
+
+    #
+    # Take over tier IDs and expire date from OscamWebif.getTiers result.
+    #
+    def setTiers(self, tiers):
+        self.tiers = tiers['tiers']
+        self.expires = tiers['expires']
 
     #
     # Read unique EMM's from Oscam config dir
     #
-    def getSavedEmm(self):
-        print "[OSS CardStatus.getSavedEmms] "
+    # @param force bool - get full list and hint even if nothing changed
+    #
+    def getSavedEmm(self, force=False):
         if self.status:
-            retemm = self.oscamConfig.getSavedEmm(self.status['reader'])
+            retemm = self.oscamConfig.getSavedEmm(self.status['reader'], force)
             self.hint = retemm['hint']
             self.list = [ ("Erstes Vorkommen", "Letztes Vorkommen", "EMM", "")]
             self.list.extend( retemm['emm'] )
-            print "[OSS CardStatus.getSavedEmms] show", len(retemm['emm']), "EMMs"
+            trace.debug("CardStatus.getSavedEmm", "show %d EMMs", len(retemm['emm']))
     
 class OscamStatus(Screen, CardStatus):
     version = "2017-06-14 1.4"
@@ -565,6 +1292,8 @@ class OscamStatus(Screen, CardStatus):
             </widget>
             <widget name="key_red" position="20,1000" zPosition="1" size="400,50" font="Regular;20" halign="center" valign="center" backgroundColor="#f01010" foregroundColor="#ffffff" transparent="0" />
             <widget name="key_green" position="440,1000" zPosition="1" size="400,50" font="Regular;20" halign="center" valign="center" backgroundColor="#10a010" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_yellow" position="860,1000" zPosition="1" size="400,50" font="Regular;20" halign="center" valign="center" backgroundColor="#a08000" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_blue" position="1280,1000" zPosition="1" size="400,50" font="Regular;20" halign="center" valign="center" backgroundColor="#1010f0" foregroundColor="#ffffff" transparent="0" />
         </screen>
         """,
         
@@ -606,9 +1335,16 @@ class OscamStatus(Screen, CardStatus):
             </widget>
             <widget name="key_red" position="10,666" zPosition="1" size="300,33" font="Regular;16" halign="center" valign="center" backgroundColor="#f01010" foregroundColor="#ffffff" transparent="0" />
             <widget name="key_green" position="320,666" zPosition="1" size="300,33" font="Regular;16" halign="center" valign="center" backgroundColor="#10a010" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_yellow" position="630,666" zPosition="1" size="300,33" font="Regular;16" halign="center" valign="center" backgroundColor="#a08000" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_blue" position="940,666" zPosition="1" size="300,33" font="Regular;16" halign="center" valign="center" backgroundColor="#1010f0" foregroundColor="#ffffff" transparent="0" />
         </screen>
         """ }
     
+    # rows loaded into the EMM list at a time, and how close to the last
+    # loaded row the cursor gets before the next page is loaded
+    EMM_PAGE = 100
+    EMM_PAGE_MARGIN = 10
+    
     hintText = {
         1: 'Liste der gespeicherten EMMs - mit OK zum Schreiben auswählen.',
         2: 'Keine EMMs gefunden. 90 Minuten auf einem Sky-Kanal warten.',
@@ -624,45 +1360,78 @@ class OscamStatus(Screen, CardStatus):
         self.hint = None
         self.emmToWrite = None
         self.payload = None
+        self.closed = False
+        # indexes of readers whose tiers are being requested
+        self.tiersPending = set()
+        # EMMs marked for writing in one batch, set to stop a running batch
+        self.emmsMarked = set()
+        self.emmBatchCancel = None
+        # rows of self.list loaded into the EMM list
+        self.emmRowsShown = 0
+        # until the first reader is shown, for metrics
+        self.openTime = time.time()
 
         self.adaptScreen()
         self.skin = OscamStatus.skin[self.useskin]
         
-        self.timerRereadEmms = eTimer()
-        self.timerRereadEmms.callback.append(self.showEmms)
+        # EMM log of the selected reader, see watchEmms
+        self.emmWatcher = None
         
         CardStatus.__init__(self, session)
         Screen.__init__(self, session)
 
-        self['actions'] =  ActionMap(['ColorActions', 'WizardActions'], {
+        self['actions'] =  ActionMap(['ColorActions', 'WizardActions', 'MenuActions'], {
             "back": self.cancel,
             "ok": self.ok,
             "red": self.red,
             "green": self.green,
+            "yellow": self.yellow,
+            "blue": self.blue,
+            "menu": self.menu,
         }, -1)
         
         self['key_red'] = Label(_("Payload ermitteln"))
         self['key_green'] = Label()
+        self['key_yellow'] = Label()
+        self['key_blue'] = Label(_("EMM markieren"))
         self['payload'] = Label(_("Payload: rot drücken"))
         self['f0tier'] = Label()
         self['cardtype'] = Label()
         self['headline'] = Label()
         self['expires'] = Label()
         self['emmlist'] = List()
+        self['emmlist'].onSelectionChanged.append(self.emmSelectionChanged)
         
         self.onLayoutFinish.append(self.showCardStatus)
 
     def cancel(self):
-        self.timerRereadEmms.stop()
+        if self.emmWatcher:
+            self.emmWatcher.stop()
+        if self.emmBatchCancel:
+            self.emmBatchCancel.set()
         if self.webif:
-            self.webif.timer.stop()
+            self.webif.stopPayload()
+        if self.oscamConfig:
+            self.oscamConfig.releaseSavedEmm()
+        self.closed = True
         self.close()
     
     #
-    # Write selected EMM to card after confirmation.
+    # Write selected EMM, or all marked EMMs, to card after confirmation.
     #
     def ok(self):
-        self.emmToWrite = str(self['emmlist'].getCurrent()[3])
+        if self.emmsMarked:
+            if self.emmBatchCancel is None:
+                self.session.openWithCallback(
+                    self.writeEmmBatch,
+                    MessageBox,
+                    _("%d markierte EMMs nacheinander schreiben?\nEs wird gestoppt, sobald sich das Ablaufdatum verschiebt.") % len(self.emmsMarked),
+                    type = MessageBox.TYPE_YESNO,
+                    timeout = -1
+                )
+            return
+
+        self.emmToWrite = binascii.hexlify(self['emmlist'].getCurrent()[3]).upper()
         if self.emmToWrite != "":
             self.session.openWithCallback(
                 self.writeEmm, 
@@ -686,7 +1455,7 @@ class OscamStatus(Screen, CardStatus):
                     self.session.openWithCallback(
                         self.fetchPayload, 
                         MessageBox, 
-                        _("Das Ermitteln des Payloads dauert etwa 10 Sekunden.\nFortfahren?"), 
+                        _("Das Ermitteln des Payloads dauert bis zu %d Sekunden.\nFortfahren?") % (OscamWebif.PAYLOAD_TIMEOUT / 1000), 
                         type = MessageBox.TYPE_YESNO,
                         timeout = -1
                     )
@@ -717,6 +1486,89 @@ class OscamStatus(Screen, CardStatus):
                 timeout = -1
             )
     
+    #
+    # Switch to the next Sky reader. Shows what was read for that reader
+    # before, only the EMM log is checked for new lines.
+    #
+    def yellow(self):
+        if len(self.readers) > 1 and self.emmBatchCancel is None:
+            self.selectReader(self.readerIndex + 1)
+            self.emmsMarked = set()
+            self.showReader()
+            self.watchEmms()
+
+    #
+    # Show hot path timing and the latest trace events.
+    #
+    def menu(self):
+        self.session.open(MetricsScreen)
+
+    #
+    # Mark or unmark selected EMM for writing in a batch.
+    #
+    def blue(self):
+        index = self['emmlist'].getIndex()
+        entry = self['emmlist'].getCurrent()
+        if not entry or not entry[3] or self.emmBatchCancel is not None:
+            return
+        key = entry[3]
+        if key in self.emmsMarked:
+            self.emmsMarked.discard(key)
+        else:
+            self.emmsMarked.add(key)
+        self['emmlist'].modifyEntry(index, self.markEntry(self.list[index]))
+
+    #
+    # @param entry tuple - row of EMM list
+    # @return tuple - row as shown, marked EMMs have a "*" in front
+    #
+    def markEntry(self, entry):
+        if entry[3] in self.emmsMarked:
+            return (entry[0], entry[1], '* ' + entry[2], entry[3])
+        return entry
+
+    #
+    # Bring the EMM list up to date with self.list. Only the first
+    # emmRowsShown rows are loaded, more are loaded while scrolling.
+    # If the loaded rows are the same EMMs in the same order, changed rows
+    # are updated in place. Otherwise the rows are replaced and the
+    # selected EMM stays selected.
+    #
+    # @param reset bool - start over with the first page, e.g. for another reader
+    #
+    @timed('screen showEmmList')
+    def showEmmList(self, reset=False):
+        if reset:
+            self.emmRowsShown = 0
+        count = min(len(self.list), max(self.emmRowsShown, self.EMM_PAGE))
+        rows = [ self.markEntry(entry) for entry in self.list[:count] ]
+        self.emmRowsShown = count
+
+        shown = self['emmlist'].list
+        if not reset and len(shown) == len(rows) and \
+                all(old[3] == new[3] for old, new in zip(shown, rows)):
+            for index in range(len(rows)):
+                if shown[index] != rows[index]:
+                    self['emmlist'].modifyEntry(index, rows[index])
+            return
+
+        current = self['emmlist'].getCurrent()
+        self['emmlist'].setList(rows)
+        if current and not reset:
+            for index in range(len(rows)):
+                if rows[index][3] == current[3]:
+                    self['emmlist'].setIndex(index)
+                    break
+
+    #
+    # Load the next page of EMMs when the cursor gets near the last loaded row.
+    #
+    def emmSelectionChanged(self):
+        if self.list and self.emmRowsShown < len(self.list) and \
+                self['emmlist'].getIndex() >= self.emmRowsShown - self.EMM_PAGE_MARGIN:
+            self.emmRowsShown += self.EMM_PAGE
+            self.showEmmList()
+
     #
     # Compute text for "f0tier" label
     #
@@ -746,46 +1598,172 @@ class OscamStatus(Screen, CardStatus):
     
     #
     # Compute card status information and set Screen elements accordingly.
+    # Web interface requests run in worker threads, the screen is updated
+    # as each response arrives.
     #
     def showCardStatus(self):
         try:
-            self.getCardStatus()
-    
-            self['f0tier'].setText(_("F0-Tier vorhanden: %s") % self.getF0text() )
-            self['cardtype'].setText( _("Kartentyp: %s") % self.getCardtype() )
+            if not self.setupWebif():
+                self.showStatusSkyAll(None)
+                return
+        except WebifException as e:
+            self['headline'].setText(_("Das Webinterface scheint nicht konfiguriert zu sein."))
+            self['key_red'].setText("")
+            self['payload'].setText("")
+            return
 
-            if self.expires:
-                self['expires'].setText(_("Karte läuft ab am: %s") % str(self.expires))
-            else:
-                self['expires'].setText(_("Status konnte nicht ermittelt werden."))
+        # readers known to the background poller are shown right away
+        poller = CardStatusPoller.instance
+        statuses = poller and poller.getStatuses()
+        if statuses is not None:
+            trace.debug("OscamStatus.showCardStatus", "status from poller")
+            self.showStatusSkyAll(statuses)
+            return
 
-            if self.status:
-                try:
-                    self['headline'].setText(_(self.hintText[self.hint]))
-                except KeyError:
-                    pass
+        self['headline'].setText(_("Status wird ermittelt ..."))
+        d = threads.deferToThread(self.webif.getStatusSkyAll)
+        d.addCallbacks(self.callbackStatusSky, self.errbackStatusSky)
 
-                self['emmlist'].setList(self.list)
-                self.timerRereadEmms.start(60000, True)
+    def callbackStatusSky(self, statuses):
+        if CardStatusPoller.instance:
+            CardStatusPoller.instance.storeStatuses(statuses)
+        self.showStatusSkyAll(statuses)
 
-                if self.list and len(self.list) < 2 and self.hint == OscamConfig.EMM_VAR_LOG:
-                    self['key_green'].setText(_("Emmlogdir fixen"))
+    def errbackStatusSky(self, failure):
+        trace.warn("OscamStatus.showCardStatus", "catch exception %s", failure.getErrorMessage())
+        self.showStatusSkyAll(None)
 
-            else:
-                if self.localhostAccess:
-                    self['headline'].setText(_("Ist Oscam gestartet? Läuft eine lokale V13/V14 Karte?"))
+    #
+    # Show the first Sky reader, then request tiers of all readers whose
+    # tiers the background poller doesn't have fresh.
+    #
+    # @param statuses None|list - result of OscamWebif.getStatusSkyAll
+    #
+    def showStatusSkyAll(self, statuses):
+        if self.closed:
+            return
+        self.setReaders(statuses or [])
+
+        if self.readers:
+            if len(self.readers) > 1:
+                self['key_yellow'].setText(_("Nächster Reader"))
+            poller = CardStatusPoller.instance
+            stale = []
+            for index in range(len(self.readers)):
+                tiers = poller and poller.getTiers(self.readers[index]['status']['reader'])
+                if tiers:
+                    self.setReaderTiers(index, tiers)
                 else:
-                    self['headline'].setText(_("In oscam.conf muss für 127.0.0.1 Zugriff erlaubt werden."))
-        except WebifException as e:
-            self['headline'].setText(_("Das Webinterface scheint nicht konfiguriert zu sein."))
-            self['key_red'].setText("")
-            self['payload'].setText("")
+                    stale.append(index)
+                    self.tiersPending.add(index)
+            self.showReader()
+            if self.openTime:
+                metrics.add('screen open', (time.time() - self.openTime) * 1000)
+                self.openTime = None
+            self.watchEmms()
+            for index in stale:
+                self.refreshTiers(index)
+
+        else:
+            self['cardtype'].setText( _("Kartentyp: %s") % self.getCardtype() )
+            if self.localhostAccess:
+                self['headline'].setText(_("Ist Oscam gestartet? Läuft eine lokale V13/V14 Karte?"))
+            else:
+                self['headline'].setText(_("In oscam.conf muss für 127.0.0.1 Zugriff erlaubt werden."))
+            self.showTiers(None)
+
+    #
+    # Show card type, saved EMMs and tiers of the selected reader.
+    #
+    @timed('screen showReader')
+    def showReader(self):
+        cardtype = _("Kartentyp: %s") % self.getCardtype()
+        if len(self.readers) > 1:
+            cardtype += " (%s, %d/%d)" % (self.status['reader'], self.readerIndex + 1, len(self.readers))
+        self['cardtype'].setText(cardtype)
+
+        self.getSavedEmm(True)
+        try:
+            self['headline'].setText(_(self.hintText[self.hint]))
+        except KeyError:
+            pass
+        self.showEmmList(True)
+
+        if self.list and len(self.list) < 2 and self.hint == OscamConfig.EMM_VAR_LOG:
+            self['key_green'].setText(_("Emmlogdir fixen"))
+        else:
+            self['key_green'].setText("")
+
+        if self.readerIndex in self.tiersPending:
+            self['f0tier'].setText("")
+            self['expires'].setText(_("Ablaufdatum wird ermittelt ..."))
+        else:
+            self.showTiers(None)
+
+    #
+    # Request tier IDs and expire date of a reader in a worker thread.
+    #
+    # @param index int|None - index into self.readers, None for the selected one
+    #
+    def refreshTiers(self, index=None):
+        if index is None:
+            index = self.readerIndex
+        self.tiersPending.add(index)
+        if index == self.readerIndex:
+            self['expires'].setText(_("Ablaufdatum wird ermittelt ..."))
+        d = threads.deferToThread(self.webif.getTiers, self.readers[index]['status']['reader'])
+        d.addCallbacks(lambda tiers: self.showTiers(tiers, index), lambda failure: self.errbackTiers(failure, index))
+
+    def errbackTiers(self, failure, index=None):
+        trace.warn("OscamStatus.refreshTiers", "catch exception %s", failure.getErrorMessage())
+        self.showTiers(None, index)
+
+    #
+    # Show F0 tier and expire date.
+    #
+    # @param tiers None|dict - result of OscamWebif.getTiers
+    # @param index int|None - reader the result belongs to, None for the selected one
+    #
+    @timed('screen showTiers')
+    def showTiers(self, tiers, index=None):
+        if self.closed:
+            return
+        if index is None:
+            index = self.readerIndex
+        self.tiersPending.discard(index)
+        if tiers and self.readers:
+            self.setReaderTiers(index, tiers)
+            if CardStatusPoller.instance:
+                CardStatusPoller.instance.storeTiers(self.readers[index]['status']['reader'], tiers, False)
+        if index != self.readerIndex:
+            return
+
+        self['f0tier'].setText(_("F0-Tier vorhanden: %s") % self.getF0text() )
+        if self.expires:
+            self['expires'].setText(_("Karte läuft ab am: %s") % str(self.expires))
+        else:
+            self['expires'].setText(_("Status konnte nicht ermittelt werden."))
 
-    def showEmms(self):
+    #
+    # Watch the unique EMM log of the selected reader, new EMMs are shown
+    # as soon as Oscam has written them.
+    #
+    def watchEmms(self):
+        if self.emmWatcher is None:
+            self.emmWatcher = LogWatcher(self.showEmms)
+        self.emmWatcher.setPaths([self.oscamConfig.getEmmLogfile(self.status['reader'])])
+
+    #
+    # LogWatcher callback: show EMMs read since the last call.
+    #
+    # @param changed set - changed log files
+    #
+    def showEmms(self, changed=None):
+        if self.closed:
+            return
         self.getSavedEmm()
         if self.hint != OscamConfig.EMM_NOCHANGE:
-            self['emmlist'].setList(self.list)
-        self.timerRereadEmms.start(60000, True)
+            self.showEmmList()
 
         
     # 
@@ -794,23 +1772,69 @@ class OscamStatus(Screen, CardStatus):
     #
     def writeEmm(self, retval):
         if retval:
-            try:
-                self.webif.writeEmm(self.status['reader'], self.status['caid'], self.emmToWrite, self.callbackWriteEmm)
-            except WebifException as e:
-                print "[OSS OscamStatus.writeEmm] catch exception", e
+            index = self.readerIndex
+            d = threads.deferToThread(self.webif.writeEmm, self.status['reader'], self.status['caid'], self.emmToWrite)
+            d.addCallbacks(lambda result: self.callbackWriteEmm(index), self.errbackWriteEmm)
+
+    def errbackWriteEmm(self, failure):
+        trace.warn("OscamStatus.writeEmm", "catch exception %s", failure.getErrorMessage())
     
     #
     # Web interface callback after writing EMM
     #
-    def callbackWriteEmm(self):
-        try:
-            tiers = self.webif.getTiers(self.status['reader'])
-            self.expires = tiers['expires']
-            self['expires'].setText(_("Karte läuft ab am: %s") % str(self.expires))
-        except WebifException as e:
-            print "[OSS OscamStatus.callbackWriteEmm] catch exception", e
+    # @param index int|None - reader the EMM was written to
+    #
+    def callbackWriteEmm(self, index=None):
+        if not self.closed:
+            self.refreshTiers(index)
 
 
+    #
+    # Write marked EMMs to card one after another in a worker thread.
+    # Callback function on OK click with marked EMMs.
+    #
+    def writeEmmBatch(self, retval):
+        if retval and self.emmsMarked:
+            emms = [ binascii.hexlify(entry[3]).upper() for entry in self.list if entry[3] in self.emmsMarked ]
+            index = self.readerIndex
+            self.emmBatchCancel = threading.Event()
+            self['headline'].setText(_("Schreibe %d EMMs ...") % len(emms))
+            progress = lambda written, total: reactor.callFromThread(self.progressWriteEmmBatch, written, total)
+            d = threads.deferToThread(self.webif.writeEmms, self.status['reader'], self.status['caid'], emms,
+                                      progress, self.emmBatchCancel)
+            d.addCallbacks(lambda result: self.callbackWriteEmmBatch(result, index), self.errbackWriteEmmBatch)
+
+    def progressWriteEmmBatch(self, written, total):
+        if not self.closed:
+            self['headline'].setText(_("EMM %d von %d geschrieben, prüfe Ablaufdatum ...") % (written, total))
+
+    def errbackWriteEmmBatch(self, failure):
+        trace.warn("OscamStatus.writeEmmBatch", "catch exception %s", failure.getErrorMessage())
+        self.emmBatchCancel = None
+        if not self.closed:
+            self['headline'].setText(_("Fehler beim Schreiben der EMMs."))
+            self.refreshTiers()
+
+    #
+    # Worker thread callback after writing marked EMMs
+    #
+    # @param result dict - result of OscamWebif.writeEmms
+    # @param index int - reader the EMMs were written to
+    #
+    def callbackWriteEmmBatch(self, result, index):
+        self.emmBatchCancel = None
+        if self.closed:
+            return
+        self.emmsMarked = set()
+        self.showEmmList()
+        self.showTiers(result['tiers'], index)
+        if result['emm']:
+            text = _("Nach %d EMMs verlängert bis %s.") % (result['written'], str(result['tiers']['expires']))
+        else:
+            text = _("%d EMMs geschrieben, das Ablaufdatum hat sich nicht verschoben.") % result['written']
+        self['headline'].setText(text)
+        self.session.open(MessageBox, text, MessageBox.TYPE_INFO)
+
     #
     # Read payload information
     # Callback action on RED click.
@@ -818,10 +1842,7 @@ class OscamStatus(Screen, CardStatus):
     def fetchPayload(self, retval):
         if retval:
             self['payload'].setText(_("Payload wird ermittelt"))
-            try:
-                self.webif.fetchPayload(self.callbackFetchPayload)
-            except WebifException as e:
-                print "[OSS OscamStatus.fetchPayload] catch exception", e
+            self.webif.fetchPayload(self.callbackFetchPayload)
 
     #
     # Web interface callback after reading payload
@@ -831,15 +1852,12 @@ class OscamStatus(Screen, CardStatus):
         if self.payload:
             self['payload'].setText(_("Payload: %s") % str(self.payload))
             
-            info = ""
-            if self.payload.startswith("0F 04 00 00 00 00") or self.payload.startswith("0F 06 00 00 00 00"):
-                info = "Die Karte ist aktiv und nicht gepairt"
-            elif self.payload.startswith("0F 04 00 10 20 00") or self.payload.startswith("0F 06 00 10 20 00"):
-                info = "Die Karte muss verlängert werden"
-            elif self.payload.startswith("0F 04 00 10 00 00") or self.payload.startswith("0F 06 00 10 00 00"):
-                info = "Die Karte ist gepairt"
-            elif self.payload.startswith("0F 04 00 00 20 00") or self.payload.startswith("0F 06 00 00 20 00"):
-                info = "Dieser Sender ist nicht abonniert"
+            # states by payload prefix from payloads.conf, read on every
+            # call so edits take effect right away
+            state, info = PayloadClassifier(PayloadClassifier.FILE).classify(self.payload)
+            trace.info("OscamStatus.callbackFetchPayload", "payload %s: %s", self.payload, state)
+            if info:
+                info = _(info)
             self.session.open(MessageBox, _("Der Payload ist: %s\n%s") % (self.payload, info), MessageBox.TYPE_INFO)
 
         else:
@@ -864,14 +1882,14 @@ class OscamStatus(Screen, CardStatus):
         info = service and service.info()
         if info:
             # On Sky 1 cards are reported "paired", so skip Sky 1.
-            print "[OSS OscamStatus.isProviderSky] payload on", info.getName()
+            trace.info("OscamStatus.isProviderSky", "payload on %s", info.getName())
             if info.getName().replace('\xc2\x86','').replace('\xc2\x87','').startswith('Sky 1'):
                 return False
             # fetch ONID (Original Network ID) and make sure it belongs to Sky (133).
             onid = info.getInfo(iServiceInformation.sONID) 
             # Skip services like Sky News that are FTA.
             isCrypted = info.getInfo(iServiceInformation.sIsCrypted)
-            print "[OSS OscamStatus.isProviderSky] ONID=%d, isCrypted=%d" % (onid, isCrypted)
+            trace.info("OscamStatus.isProviderSky", "ONID=%d, isCrypted=%d", onid, isCrypted)
             return onid == 133 and isCrypted == 1
         return False
 
@@ -885,3 +1903,105 @@ class OscamStatus(Screen, CardStatus):
         else:
             self.useskin = "fhd"
     
+
+class MetricsScreen(Screen):
+    """Hot path timing recorded so far (debug mode only, see Metrics.py)
+    and the latest trace events (see Trace.py).
+    Green writes the timing as JSON to METRICS_FILE, yellow starts over,
+    blue writes the trace buffer in Chrome trace format to TRACE_FILE.
+    """
+    
+    METRICS_FILE = '/tmp/OscamSkydeStatus-metrics.json'
+    TRACE_FILE = '/tmp/OscamSkydeStatus-trace.json'
+    # trace events shown below the timing
+    TRACE_LINES = 100
+    
+    skin = { "fhd": """
+        <screen name="OscamStatusMetrics" position="0,0" size="1920,1080" title="Oscam Sky DE Status Metrics" flags="wfNoBorder">
+            <widget name="headline" position="20,20" size="1880,36" font="Regular;25" />
+            <widget name="report" position="20,70" size="1880,910" font="Regular;22" />
+            <widget name="key_green" position="440,1000" zPosition="1" size="400,50" font="Regular;20" halign="center" valign="center" backgroundColor="#10a010" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_yellow" position="860,1000" zPosition="1" size="400,50" font="Regular;20" halign="center" valign="center" backgroundColor="#a08000" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_blue" position="1280,1000" zPosition="1" size="400,50" font="Regular;20" halign="center" valign="center" backgroundColor="#1010f0" foregroundColor="#ffffff" transparent="0" />
+        </screen>
+        """,
+        
+        "hd": """
+        <screen name="OscamStatusMetrics" position="0,0" size="1280,720" title="Oscam Sky DE Status Metrics" flags="wfNoBorder">
+            <widget name="headline" position="10,10" size="1260,24" font="Regular;18" />
+            <widget name="report" position="10,40" size="1260,610" font="Regular;15" />
+            <widget name="key_green" position="320,666" zPosition="1" size="300,33" font="Regular;16" halign="center" valign="center" backgroundColor="#10a010" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_yellow" position="630,666" zPosition="1" size="300,33" font="Regular;16" halign="center" valign="center" backgroundColor="#a08000" foregroundColor="#ffffff" transparent="0" />
+            <widget name="key_blue" position="940,666" zPosition="1" size="300,33" font="Regular;16" halign="center" valign="center" backgroundColor="#1010f0" foregroundColor="#ffffff" transparent="0" />
+        </screen>
+        """ }
+    
+    def __init__(self, session):
+        if getDesktop(0).size().width() < 1920:
+            self.skin = MetricsScreen.skin["hd"]
+        else:
+            self.skin = MetricsScreen.skin["fhd"]
+        Screen.__init__(self, session)
+        
+        self['actions'] = ActionMap(['ColorActions', 'WizardActions'], {
+            "back": self.close,
+            "ok": self.close,
+            "up": self.pageUp,
+            "down": self.pageDown,
+            "green": self.green,
+            "yellow": self.yellow,
+            "blue": self.blue,
+        }, -1)
+        
+        self['headline'] = Label()
+        self['report'] = ScrollLabel()
+        self['key_green'] = Label(_("Als JSON speichern") if metrics.enabled else "")
+        self['key_yellow'] = Label(_("Zurücksetzen"))
+        self['key_blue'] = Label(_("Trace speichern"))
+        
+        self.onLayoutFinish.append(self.showReport)
+    
+    def showReport(self):
+        if metrics.enabled:
+            self['headline'].setText(_("Messwerte der letzten %d Sekunden") % metrics.report()['seconds'])
+            lines = metrics.reportLines() + [""]
+        else:
+            self['headline'].setText(_("Messwerte nur im Debug-Modus, letzte Trace-Einträge:"))
+            lines = []
+        lines.extend(reversed(trace.lines(self.TRACE_LINES)))
+        self['report'].setText("\n".join(lines))
+    
+    def pageUp(self):
+        self['report'].pageUp()
+    
+    def pageDown(self):
+        self['report'].pageDown()
+    
+    #
+    # Write report to METRICS_FILE.
+    #
+    def green(self):
+        if not metrics.enabled:
+            return
+        try:
+            metrics.dump(self.METRICS_FILE)
+            self['headline'].setText(_("Gespeichert in %s") % self.METRICS_FILE)
+        except IOError as e:
+            trace.warn("MetricsScreen.green", "catch exception %s", e)
+            self['headline'].setText(_("Speichern fehlgeschlagen."))
+    
+    def yellow(self):
+        metrics.reset()
+        trace.clear()
+        self.showReport()
+    
+    #
+    # Write trace buffer to TRACE_FILE.
+    #
+    def blue(self):
+        try:
+            count = trace.exportChrome(self.TRACE_FILE)
+            self['headline'].setText(_("%d Trace-Einträge gespeichert in %s") % (count, self.TRACE_FILE))
+        except IOError as e:
+            trace.warn("MetricsScreen.blue", "catch exception %s", e)
+            self['headline'].setText(_("Speichern fehlgeschlagen."))
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+import ConfigParser
+import base64
+import gzip
+import os
+import re
+import sys
+
+class PayloadScanner:
+    """Finds card payloads in Oscam live log lines.
+
+    At debug level 4 Oscam logs a "Decrypted payload" line, the payload
+    itself follows two lines below. Live log lines from logpoll.html are
+    base64 encoded; the marker is searched in the encoded text, so only
+    the lines that carry a payload have to be decoded, and a logpoll
+    response without any marker can be skipped without parsing it.
+
+    The scan state is kept between calls, so lines can be fed in chunks.
+    Does not depend on enigma2.
+    """
+
+    MARKER = 'Decrypted payload'
+    PAYLOAD = re.compile(r'(0F 0[46] .. .. .. .. .. ..)')
+
+    def __init__(self):
+        self.lookAhead = 0
+        self.m0, self.m1, self.m2 = self._encodeMarker(self.MARKER)
+
+    #
+    # Compute the base64 representations of marker for each of the three
+    # possible byte alignments, without the characters that depend on the
+    # surrounding bytes.
+    #
+    # @param marker string - plain text to search for
+    # @return list - base64 substrings (unicode, like json text), one of
+    #                which is in every encoded text containing marker
+    #
+    def _encodeMarker(self, marker):
+        encoded = []
+        for pad in range(3):
+            b64 = base64.b64encode('\0' * pad + marker)
+            start = (8 * pad + 5) // 6
+            end = 8 * (pad + len(marker)) // 6
+            encoded.append(unicode(b64[start:end]))
+        return encoded
+
+    #
+    # @param encoded unicode - base64 encoded line or whole logpoll response
+    # @return bool - True if the text may contain a marker line
+    #
+    def hasMarker(self, encoded):
+        return self.m0 in encoded or self.m1 in encoded or self.m2 in encoded
+
+    #
+    # @return bool - True if a marker line was seen, but its payload not yet
+    #
+    def isPending(self):
+        return self.lookAhead > 0
+
+    #
+    # Read payload from one line of decoded log text.
+    #
+    # @return string|None - payload if pattern matches.
+    #
+    def getPayloadFromLine(self, line):
+        m = self.PAYLOAD.search(line)
+        if m:
+            return m.group(1)
+        return None
+
+    #
+    # Search base64 encoded live log lines for payloads.
+    #
+    # @param lines list - line entries from logpoll.html ({ 'line': base64 })
+    # @return list - payloads in order of appearance
+    #
+    def scanLines(self, lines):
+        payloads = []
+        for line in lines:
+            encoded = line['line']
+            if self.lookAhead:
+                self.lookAhead -= 1
+                if self.lookAhead == 0:
+                    payload = self.getPayloadFromLine(base64.b64decode(encoded))
+                    if payload:
+                        payloads.append(payload)
+                    continue
+            if self.m0 in encoded or self.m1 in encoded or self.m2 in encoded:
+                self.lookAhead = 2
+        return payloads
+
+    #
+    # Search plain text log lines for payloads.
+    #
+    # @param lines iterable - decoded log lines
+    # @return list - payloads in order of appearance
+    #
+    def scanText(self, lines):
+        return [ payload for line, payload in self.iterText(lines) ]
+
+    #
+    # Like scanText, but streaming and with the line each payload was
+    # found in, e.g. for its date.
+    #
+    # @param lines iterable - decoded log lines
+    # @return generator - tuples of line and payload
+    #
+    def iterText(self, lines):
+        for line in lines:
+            if self.lookAhead:
+                self.lookAhead -= 1
+                if self.lookAhead == 0:
+                    payload = self.getPayloadFromLine(line)
+                    if payload:
+                        yield line, payload
+                    continue
+            if self.MARKER in line:
+                self.lookAhead = 2
+
+class PayloadClassifier:
+    """Card state of a payload, by payload prefix.
+
+    The prefixes are read from a data file (payloads.conf next to this
+    module), so states can be added without code changes. The longest
+    matching prefix wins.
+    """
+
+    FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'payloads.conf')
+
+    def __init__(self, path=None):
+        # prefix -> state, text
+        self.prefixes = {}
+        # prefix lengths, longest first
+        self.lengths = []
+        if path:
+            self.load(path)
+
+    #
+    # Read prefixes from a data file, see payloads.conf.
+    #
+    # @param path string - file name
+    # @return bool - True if the file could be read
+    #
+    def load(self, path):
+        cp = ConfigParser.RawConfigParser()
+        if not cp.read(path):
+            return False
+        for state in cp.sections():
+            text = ''
+            if cp.has_option(state, 'text'):
+                text = cp.get(state, 'text')
+            if cp.has_option(state, 'prefixes'):
+                for prefix in cp.get(state, 'prefixes').split(','):
+                    if prefix.strip():
+                        self.add(prefix, state, text)
+        return True
+
+    def add(self, prefix, state, text):
+        prefix = self.normalize(prefix)
+        self.prefixes[prefix] = (state, text)
+        if len(prefix) not in self.lengths:
+            self.lengths.append(len(prefix))
+            self.lengths.sort(reverse=True)
+
+    #
+    # @param payload string - hex bytes
+    # @return string - upper case, bytes separated by one space
+    #
+    def normalize(self, payload):
+        return ' '.join(payload.upper().split())
+
+    #
+    # @param payload string - payload as found by PayloadScanner
+    # @return tuple - state and text, None and '' if unknown
+    #
+    def classify(self, payload):
+        payload = self.normalize(payload)
+        for length in self.lengths:
+            found = self.prefixes.get(payload[:length])
+            if found:
+                return found
+        return (None, '')
+
+class PayloadTimeline:
+    """Card states over time, from saved Oscam logs written at debug
+    level 4.
+
+    Logs, also gzip compressed ones, are streamed line by line through a
+    PayloadScanner. Payloads are kept per reader with their date, and
+    consecutive payloads of the same state make one period of the
+    timeline. Files can be added in any order; a payload block split
+    by log rotation is not found.
+    """
+
+    # start of an Oscam log line: date, thread, type, reader label
+    LOGLINE = re.compile(r'(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})\s+\S+\s+\S\s+(\S+)')
+
+    def __init__(self, classifier):
+        self.classifier = classifier
+        # date, reader, payload
+        self.payloads = []
+
+    #
+    # @param path string - Oscam log file, may be gzip compressed
+    # @return int - number of payloads found
+    #
+    def addFile(self, path):
+        if path.endswith('.gz'):
+            log = gzip.open(path, 'rb')
+        else:
+            log = open(path, 'rb')
+        try:
+            return self.addLines(log)
+        finally:
+            log.close()
+
+    #
+    # @param lines iterable - Oscam log lines
+    # @return int - number of payloads found
+    #
+    def addLines(self, lines):
+        found = 0
+        for line, payload in PayloadScanner().iterText(lines):
+            m = self.LOGLINE.match(line)
+            if m:
+                self.payloads.append((m.group(1), m.group(2), payload))
+            else:
+                self.payloads.append(('', '', payload))
+            found += 1
+        return found
+
+    #
+    # @return list - periods as dicts: reader, state (or the payload if
+    #                unknown), text, first and last payload, first and
+    #                last date, number of payloads; by reader and date
+    #
+    def periods(self):
+        periods = []
+        current = None
+        for date, reader, payload in sorted(self.payloads, key=lambda entry: (entry[1], entry[0])):
+            state, text = self.classifier.classify(payload)
+            state = state or payload
+            if current and current['reader'] == reader and current['state'] == state:
+                current['last'] = date
+                current['lastPayload'] = payload
+                current['count'] += 1
+            else:
+                current = { 'reader': reader, 'state': state, 'text': text,
+                            'firstPayload': payload, 'lastPayload': payload,
+                            'first': date, 'last': date, 'count': 1 }
+                periods.append(current)
+        return periods
+
+#
+# Batch mode: print the timeline of card states found in saved Oscam logs.
+#
+# Usage: python Payload.py [--conf payloads.conf] oscam.log [oscam.log.1.gz ...]
+#
+def main(args):
+    path = PayloadClassifier.FILE
+    if args[0:1] == ['--conf']:
+        path = args[1]
+        args = args[2:]
+    timeline = PayloadTimeline(PayloadClassifier(path))
+    for name in args:
+        timeline.addFile(name)
+    for period in timeline.periods():
+        print "%s  %s - %s  %4d x  %-12s %s  %s" % (period['reader'], period['first'], period['last'],
+            period['count'], period['state'], period['firstPayload'], period['text'])
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+import datetime
+import re
+import time
+
+from enigma import eTimer
+from twisted.internet import threads
+
+from __init__ import _
+from Trace import trace
+
+class CardStatusPoller:
+    """Keeps card status warm in the background while enigma2 runs.
+
+    Started from the session start hook in plugin.py. Every EMM_INTERVAL
+    the unique EMM logs of the known Sky readers are read into their
+    index, every WEBIF_INTERVAL reader status and entitlements are read
+    from the web interface, both in a worker thread. The OscamStatus screen
+    takes the results from here and only requests what is older than
+    MAX_AGE.
+
+    A notification is shown when the expire date of a reader changes, and
+    once a day while it is less than WARN_DAYS away.
+
+    OscamStatus is imported on the first poll, not at session start.
+    """
+
+    # s after session start until the first poll
+    START_DELAY = 120
+    EMM_INTERVAL = 600
+    WEBIF_INTERVAL = 1800
+    # s until cached status and tiers are requested again by the screen,
+    # 35 min, longer than WEBIF_INTERVAL so the screen never asks between
+    # two polls
+    MAX_AGE = WEBIF_INTERVAL + 300
+    WARN_DAYS = 14
+
+    # the running poller, None if not started
+    instance = None
+
+    def __init__(self, session):
+        self.session = session
+        self.statuses = None
+        self.statusTime = 0
+        # reader label -> result of OscamWebif.getTiers and time read
+        self.tiers = {}
+        # reader label -> expire date last seen, date of last warning
+        self.expires = {}
+        self.warned = {}
+        self.webifTime = 0
+        self.running = False
+        self.timer = eTimer()
+        self.timer.callback.append(self.poll)
+
+    def start(self):
+        CardStatusPoller.instance = self
+        self.timer.start(self.START_DELAY * 1000, True)
+
+    def stop(self):
+        self.timer.stop()
+        if CardStatusPoller.instance is self:
+            CardStatusPoller.instance = None
+
+    #
+    # Timer callback. Reading the EMM logs and the web interface requests
+    # run in a worker thread: without an index, the first read parses the
+    # whole log. The results are stored back in the main loop.
+    # Whatever fails, the next poll is scheduled.
+    #
+    def poll(self):
+        if self.running:
+            return
+        try:
+            from OscamStatus import CardStatus
+            cardStatus = CardStatus(None)
+            if cardStatus.setupWebif():
+                fetch = time.time() - self.webifTime >= self.WEBIF_INTERVAL
+                self.running = True
+                d = threads.deferToThread(self._work, cardStatus, self.statuses, fetch)
+                d.addCallbacks(self._callbackFetch, lambda failure: self._errbackFetch(failure, fetch))
+        except Exception as e:
+            trace.warn("CardStatusPoller.poll", "catch exception %s", e)
+            self.running = False
+        finally:
+            # the worker callbacks schedule the next poll
+            if not self.running:
+                self._schedule()
+
+    def _schedule(self):
+        self.timer.start(self.EMM_INTERVAL * 1000, True)
+
+    #
+    # Worker thread: read new lines of the EMM logs of the known readers,
+    # and status and tiers of all Sky readers if due. The EMM logs of
+    # readers found for the first time are read as well.
+    #
+    # @param cardStatus CardStatus - the poller's own, not shared with screens
+    # @param statuses list|None - Sky readers known so far
+    # @param fetch bool - request the web interface
+    # @return tuple|None - result of getStatusSkyAll, result of getTiersAll;
+    #                      None if not fetched
+    #
+    def _work(self, cardStatus, statuses, fetch):
+        self._updateEmms(cardStatus, statuses)
+        if not fetch:
+            return None
+        webif = cardStatus.webif
+        fetched = webif.getStatusSkyAll()
+        tiers = webif.getTiersAll([status['reader'] for status in fetched])
+        if statuses is None:
+            self._updateEmms(cardStatus, fetched)
+        return fetched, tiers
+
+    def _updateEmms(self, cardStatus, statuses):
+        for status in statuses or []:
+            cardStatus.oscamConfig.updateSavedEmm(status['reader'])
+
+    def _callbackFetch(self, result):
+        self.running = False
+        try:
+            if result is not None:
+                self.webifTime = time.time()
+                statuses, tiers = result
+                self.storeStatuses(statuses)
+                for reader in tiers:
+                    self.storeTiers(reader, tiers[reader])
+        except Exception as e:
+            trace.warn("CardStatusPoller.poll", "catch exception %s", e)
+        finally:
+            self._schedule()
+
+    def _errbackFetch(self, failure, fetch):
+        trace.warn("CardStatusPoller.poll", "catch exception %s", failure.getErrorMessage())
+        self.running = False
+        if fetch:
+            self.webifTime = time.time()
+        self._schedule()
+
+    #
+    # @return list|None - result of OscamWebif.getStatusSkyAll if not
+    #                     older than MAX_AGE
+    #
+    def getStatuses(self):
+        if self.statuses is not None and time.time() - self.statusTime < self.MAX_AGE:
+            return self.statuses
+        return None
+
+    #
+    # Remember the Sky readers, e.g. as requested by the screen.
+    #
+    # @param statuses list - result of OscamWebif.getStatusSkyAll
+    #
+    def storeStatuses(self, statuses):
+        self.statuses = statuses
+        self.statusTime = time.time()
+
+    #
+    # @param reader string - label of reader
+    # @return dict|None - result of OscamWebif.getTiers if not older than MAX_AGE
+    #
+    def getTiers(self, reader):
+        cached = self.tiers.get(reader)
+        if cached and time.time() - cached['time'] < self.MAX_AGE:
+            return cached['tiers']
+        return None
+
+    #
+    # Remember tiers of a reader and check its expire date.
+    #
+    # @param reader string - label of reader
+    # @param tiers dict - result of OscamWebif.getTiers
+    # @param notify bool - show notification on changed expire date,
+    #                      False if the user sees the new date anyway
+    #
+    def storeTiers(self, reader, tiers, notify=True):
+        self.tiers[reader] = { 'tiers': tiers, 'time': time.time() }
+        expires = tiers['expires']
+        if not expires:
+            return
+
+        last = self.expires.get(reader)
+        self.expires[reader] = expires
+        if last and last != expires and notify:
+            self._notify(_("Karte %s: Ablaufdatum geändert von %s auf %s") % (str(reader), str(last), str(expires)))
+            return
+
+        days = self._daysLeft(expires)
+        today = datetime.date.today()
+        if days is not None and days < self.WARN_DAYS and self.warned.get(reader) != today:
+            self.warned[reader] = today
+            if notify and days < 0:
+                self._notify(_("Karte %s ist am %s abgelaufen.") % (str(reader), str(expires)))
+            elif notify:
+                self._notify(_("Karte %s läuft in %d Tagen ab (%s).") % (str(reader), days, str(expires)))
+
+    #
+    # @param expires string - expire date as formatted by OscamWebif
+    # @return int|None - days from today
+    #
+    def _daysLeft(self, expires):
+        m = re.match(r"(\d+)\. (\d+)\. (\d+)", expires)
+        if m:
+            try:
+                date = datetime.date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+                return (date - datetime.date.today()).days
+            except ValueError:
+                pass
+        return None
+
+    def _notify(self, text):
+        from Screens.MessageBox import MessageBox
+        from Tools import Notifications
+        trace.info("CardStatusPoller._notify", "%s", text)
+        Notifications.AddNotification(MessageBox, text, MessageBox.TYPE_INFO, timeout=30)
+
+#
+# Start the background poller for a session.
+#
+def startPoller(session):
+    if CardStatusPoller.instance:
+        CardStatusPoller.instance.stop()
+    CardStatusPoller(session).start()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import collections
+import json
+import os
+import thread
+import threading
+import time
+
+class Tracer:
+    """Leveled trace events in a bounded in-memory ring buffer.
+
+    Events at or below level are kept, the oldest are dropped once the
+    buffer is full. Events at or below printLevel are also printed to the
+    enigma2 log like before ("[OSS where] message"). Below both levels a
+    call costs a comparison; messages are only formatted when printed or
+    exported, so pass the values as arguments:
+
+        trace.debug("OscamWebif._get", "URL: %s => %s", url, status)
+
+    Spans are events with a duration, e.g. a web interface request. The
+    buffer can be written in Chrome trace format, to be opened in
+    chrome://tracing or Perfetto.
+
+    Does not depend on enigma2.
+    """
+
+    OFF, ERROR, WARN, INFO, DEBUG = range(5)
+    NAMES = ['off', 'error', 'warn', 'info', 'debug']
+
+    def __init__(self, size=4000):
+        self.events = collections.deque(maxlen=size)
+        self.setLevel(self.INFO, self.WARN)
+
+    #
+    # @param level int - keep events up to this level
+    # @param printLevel int|None - also print events up to this level,
+    #                              None: leave as it is
+    #
+    def setLevel(self, level, printLevel=None):
+        self.level = level
+        if printLevel is not None:
+            self.printLevel = printLevel
+        # one comparison decides if an event is of any interest
+        self.threshold = max(self.level, self.printLevel)
+
+    def clear(self):
+        self.events.clear()
+
+    def error(self, where, message, *args):
+        if self.threshold >= self.ERROR:
+            self._record(self.ERROR, where, None, message, args)
+
+    def warn(self, where, message, *args):
+        if self.threshold >= self.WARN:
+            self._record(self.WARN, where, None, message, args)
+
+    def info(self, where, message, *args):
+        if self.threshold >= self.INFO:
+            self._record(self.INFO, where, None, message, args)
+
+    def debug(self, where, message, *args):
+        if self.threshold >= self.DEBUG:
+            self._record(self.DEBUG, where, None, message, args)
+
+    #
+    # Record an event that lasted from start until now.
+    #
+    # @param level int - trace level
+    # @param where string - what was running, e.g. "OscamWebif._get"
+    # @param start float - time.time() when it started
+    # @param message string|None - format string for args
+    #
+    def span(self, level, where, start, message=None, *args):
+        if self.threshold >= level:
+            self._record(level, where, start, message, args)
+
+    def _record(self, level, where, start, message, args):
+        now = time.time()
+        if level <= self.level:
+            if start is None:
+                self.events.append((now, None, level, thread.get_ident(), where, message, args))
+            else:
+                self.events.append((start, now - start, level, thread.get_ident(), where, message, args))
+        if level <= self.printLevel:
+            text = self._format(message, args)
+            if start is not None:
+                text = ("%s (%.1f ms)" % (text, (now - start) * 1000)).lstrip()
+            print "[OSS %s] %s" % (where, text)
+
+    #
+    # @return string - message with args filled in
+    #
+    def _format(self, message, args):
+        if message is None:
+            return ''
+        if not args:
+            return message
+        try:
+            return message % args
+        except (TypeError, ValueError, UnicodeError):
+            return message + ' ' + ' '.join(repr(arg) for arg in args)
+
+    #
+    # @param count int - number of events, the latest
+    # @return list - text lines, oldest first
+    #
+    def lines(self, count=50):
+        events = list(self.events)[-count:]
+        lines = []
+        for ts, duration, level, ident, where, message, args in events:
+            line = "%s.%03d %-5s %s %s" % (time.strftime("%H:%M:%S", time.localtime(ts)), int(ts * 1000) % 1000,
+                                           self.NAMES[level], where, self._format(message, args))
+            if duration is not None:
+                line += " (%.1f ms)" % (duration * 1000)
+            lines.append(line)
+        return lines
+
+    #
+    # Write the buffer in Chrome trace format (JSON object format).
+    #
+    # @param path string - file name
+    # @return int - number of events written
+    #
+    def exportChrome(self, path):
+        pid = os.getpid()
+        names = dict((t.ident, t.name) for t in threading.enumerate())
+        traceEvents = []
+        idents = set()
+        for ts, duration, level, ident, where, message, args in list(self.events):
+            event = { 'name': where, 'cat': self.NAMES[level], 'pid': pid, 'tid': ident, 'ts': int(ts * 1000000) }
+            if duration is None:
+                event['ph'] = 'i'
+                event['s'] = 't'
+            else:
+                event['ph'] = 'X'
+                event['dur'] = int(duration * 1000000)
+            text = self._format(message, args)
+            if text:
+                if isinstance(text, str):
+                    text = text.decode('utf-8', 'replace')
+                event['args'] = { 'message': text }
+            traceEvents.append(event)
+            idents.add(ident)
+        for ident in idents:
+            if ident in names:
+                traceEvents.append({ 'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': ident,
+                                     'args': { 'name': names[ident] } })
+        with open(path, 'wb') as f:
+            json.dump({ 'traceEvents': traceEvents, 'displayTimeUnit': 'ms' }, f)
+        return len(traceEvents)
+
+# shared by all modules and threads
+trace = Tracer()
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+import errno
+import os
+import select
+import struct
+
+from enigma import eSocketNotifier, eTimer
+
+from Trace import trace
+
+# libc loaded once, see _loadLibc
+_libc = None
+
+#
+# Load libc, by its usual name first: find_library runs ldconfig or gcc.
+#
+# @return ctypes.CDLL - libc
+#
+def _loadLibc():
+    global _libc
+    if _libc is None:
+        import ctypes
+        try:
+            _libc = ctypes.CDLL('libc.so.6', use_errno=True)
+        except OSError:
+            import ctypes.util
+            _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    return _libc
+
+class Inotify:
+    """Minimal inotify binding via ctypes: watch directories, read events.
+
+    Events are read without blocking. Raises OSError if inotify is not
+    available, e.g. libc without inotify, kernel without support or an
+    image without python-ctypes.
+    """
+
+    IN_MODIFY      = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM  = 0x00000040
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF   = 0x00000800
+    IN_Q_OVERFLOW  = 0x00004000
+    IN_IGNORED     = 0x00008000
+
+    # struct inotify_event: wd, mask, cookie, len, followed by name
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self):
+        try:
+            import ctypes
+            import fcntl
+            libc = _loadLibc()
+            self._addWatch = libc.inotify_add_watch
+            self._rmWatch = libc.inotify_rm_watch
+            init = libc.inotify_init
+        except (ImportError, OSError, AttributeError) as e:
+            raise OSError(errno.ENOSYS, "no inotify: %s" % e)
+        self._getErrno = ctypes.get_errno
+        self._addWatch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rmWatch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = init()
+        if self.fd < 0:
+            raise OSError(self._getErrno(), "inotify_init failed")
+        # O_NONBLOCK from fcntl, IN_NONBLOCK differs between architectures
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFL)
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        flags = fcntl.fcntl(self.fd, fcntl.F_GETFD)
+        fcntl.fcntl(self.fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+    #
+    # @param path string - directory to watch
+    # @param mask int - IN_* events of interest
+    # @return int - watch descriptor
+    #
+    def addWatch(self, path, mask):
+        wd = self._addWatch(self.fd, path, mask)
+        if wd < 0:
+            error = self._getErrno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def removeWatch(self, wd):
+        self._rmWatch(self.fd, wd)
+
+    #
+    # @return list - tuples of watch descriptor, mask and file name
+    #
+    def readEvents(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not data:
+                break
+            pos = 0
+            while pos + self.EVENT.size <= len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, pos)
+                pos += self.EVENT.size
+                name = data[pos:pos+length].rstrip('\0')
+                pos += length
+                events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class LogWatcher:
+    """Calls back when log files change, e.g. the unique EMM log of the
+    selected reader.
+
+    The files are watched with inotify for writes, their directories for
+    files created, moved and deleted, from the enigma2 main loop via
+    eSocketNotifier. So nothing runs while the logs are idle, and writes
+    to other logs in the same directory, e.g. oscam.log, don't wake the
+    main loop. Events are collected for DELAY ms, so a burst of EMM lines
+    results in one callback. Rotated logs (<file>.1, <file>.gz, ...)
+    count as changes of their file.
+
+    Without inotify the files are polled: every POLL_MIN ms after a
+    change, the interval doubles with every poll without change up to
+    POLL_MAX ms. A poll is one stat per file.
+    """
+
+    DELAY = 250
+    POLL_MIN = 1000
+    POLL_MAX = 30000
+
+    DIRECTORY_MASK = Inotify.IN_CREATE | Inotify.IN_MOVED_TO | Inotify.IN_MOVED_FROM | Inotify.IN_DELETE | \
+                     Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF
+    FILE_MASK = Inotify.IN_MODIFY | Inotify.IN_CLOSE_WRITE
+
+    #
+    # @param callback function - called with the set of changed files
+    #
+    def __init__(self, callback):
+        self.callback = callback
+        self.paths = []
+        self.changed = set()
+        self.inotify = None
+        self.notifier = None
+        # watch descriptor -> directory
+        self.watches = {}
+        # watch descriptor -> watched file
+        self.fileWatches = {}
+        # path -> stat signature, for polling
+        self.signatures = {}
+        self.interval = self.POLL_MIN
+
+        self.timer = eTimer()
+        self.timer.callback.append(self._fire)
+        self.pollTimer = eTimer()
+        self.pollTimer.callback.append(self._poll)
+
+        try:
+            self.inotify = Inotify()
+            self.notifier = eSocketNotifier(self.inotify.fd, select.POLLIN)
+            self.notifier.callback.append(self._readEvents)
+        except OSError as e:
+            trace.warn("LogWatcher.__init__", "no inotify, polling: %s", e)
+            self.inotify = None
+
+    #
+    # @return bool - True if inotify is used, False if files are polled
+    #
+    def isNotified(self):
+        return self.inotify is not None
+
+    #
+    # Watch these files instead of the ones watched so far.
+    #
+    # @param paths list - file names, they need not exist yet
+    #
+    def setPaths(self, paths):
+        self.paths = list(paths)
+        self.changed = set()
+        self.timer.stop()
+        if self.inotify:
+            directories = set(os.path.dirname(path) or '.' for path in self.paths)
+            for wd in self.watches.keys():
+                if self.watches[wd] not in directories:
+                    self.inotify.removeWatch(wd)
+                    del self.watches[wd]
+            for directory in directories - set(self.watches.values()):
+                try:
+                    self.watches[self.inotify.addWatch(directory, self.DIRECTORY_MASK)] = directory
+                except OSError as e:
+                    trace.warn("LogWatcher.setPaths", "can't watch %s, polling: %s", directory, e)
+                    self._closeInotify()
+                    break
+        if self.inotify:
+            for wd in self.fileWatches.keys():
+                self.inotify.removeWatch(wd)
+            self.fileWatches = {}
+            for path in self.paths:
+                self._watchFile(path)
+        if not self.inotify:
+            self.signatures = dict((path, self._signature(path)) for path in self.paths)
+            self.interval = self.POLL_MIN
+            self.pollTimer.start(self.interval, True)
+
+    def stop(self):
+        self.timer.stop()
+        self.pollTimer.stop()
+        self.paths = []
+        self._closeInotify()
+
+    def _closeInotify(self):
+        if self.inotify:
+            # the notifier must be gone before its fd is closed
+            self.notifier = None
+            self.inotify.close()
+            self.inotify = None
+        self.watches = {}
+        self.fileWatches = {}
+
+    #
+    # Watch a file for writes, if it exists.
+    #
+    # @param path string - file name
+    #
+    def _watchFile(self, path):
+        try:
+            self.fileWatches[self.inotify.addWatch(path, self.FILE_MASK)] = path
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                trace.info("LogWatcher._watchFile", "can't watch %s: %s", path, e)
+
+    #
+    # Stop watching a file for writes, e.g. when it was moved or deleted.
+    #
+    # @param path string - file name
+    #
+    def _unwatchFile(self, path):
+        for wd in [wd for wd in self.fileWatches if self.fileWatches[wd] == path]:
+            self.inotify.removeWatch(wd)
+            del self.fileWatches[wd]
+
+    #
+    # @param name string - file name in a watched directory
+    # @param directory string - the directory
+    # @return string|None - watched path the file belongs to
+    #
+    def _match(self, directory, name):
+        for path in self.paths:
+            base = os.path.basename(path)
+            if (os.path.dirname(path) or '.') == directory and \
+                    (name == base or name.startswith(base + '.')):
+                return path
+        return None
+
+    #
+    # eSocketNotifier callback: inotify events are waiting.
+    #
+    def _readEvents(self, what=None):
+        try:
+            events = self.inotify.readEvents()
+        except OSError as e:
+            trace.warn("LogWatcher._readEvents", "catch exception %s, polling", e)
+            self._fallBack()
+            return
+        for wd, mask, name in events:
+            # events of watches removed in setPaths are left over
+            directory = self.watches.get(wd)
+            if mask & Inotify.IN_Q_OVERFLOW:
+                self.changed.update(self.paths)
+            elif wd in self.fileWatches:
+                if mask & Inotify.IN_IGNORED:
+                    # file deleted, the directory watch reports it
+                    del self.fileWatches[wd]
+                else:
+                    self.changed.add(self.fileWatches[wd])
+            elif directory is None:
+                continue
+            elif mask & (Inotify.IN_IGNORED | Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF):
+                trace.info("LogWatcher._readEvents", "%s gone, polling", directory)
+                self._fallBack()
+                return
+            else:
+                path = self._match(directory, name)
+                if path:
+                    self.changed.add(path)
+                    # rotated or written again: watch the file now there
+                    if name == os.path.basename(path):
+                        self._unwatchFile(path)
+                        if mask & (Inotify.IN_CREATE | Inotify.IN_MOVED_TO):
+                            self._watchFile(path)
+        if self.changed and not self.timer.isActive():
+            self.timer.start(self.DELAY, True)
+
+    def _fire(self):
+        changed = self.changed
+        self.changed = set()
+        if changed:
+            trace.debug("LogWatcher._fire", "changed: %s", ', '.join(sorted(changed)))
+            self.callback(changed)
+
+    #
+    # Switch from inotify to polling. Changes may have been missed, so
+    # all files count as changed.
+    #
+    def _fallBack(self):
+        self._closeInotify()
+        self.setPaths(self.paths)
+        self.changed.update(self.paths)
+        self.timer.start(self.DELAY, True)
+
+    #
+    # @return tuple|None - inode, size and mtime of file, None if missing
+    #
+    def _signature(self, path):
+        try:
+            stat = os.stat(path)
+            return (stat.st_ino, stat.st_size, stat.st_mtime)
+        except OSError:
+            return None
+
+    #
+    # Timer callback when polling.
+    #
+    def _poll(self):
+        changed = set()
+        for path in self.paths:
+            signature = self._signature(path)
+            if signature != self.signatures.get(path):
+                self.signatures[path] = signature
+                changed.add(path)
+        if changed:
+            self.interval = self.POLL_MIN
+        else:
+            self.interval = min(self.interval * 2, self.POLL_MAX)
+        if self.paths:
+            self.pollTimer.start(self.interval, True)
+        if changed:
+            self.callback(changed)
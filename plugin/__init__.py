@@ -9,18 +9,32 @@ import os
 PluginLanguageDomain = "OscamSkydeStatus"
 PluginLanguagePath = "Extensions/OscamSkydeStatus/locale"
 
+# translations looked up so far, cleared on language change
+translations = {}
+
 def localeInit():
     lang = language.getLanguage()[:2]
     os.environ["LANGUAGE"] = lang
     print "[OSS] set language to ", lang
     gettext.bindtextdomain(PluginLanguageDomain, resolveFilename(SCOPE_PLUGINS, PluginLanguagePath))
+    translations.clear()
+    localeInit.done = True
+
+localeInit.done = False
 
 def _(txt):
+    try:
+        return translations[txt]
+    except KeyError:
+        pass
+    if not localeInit.done:
+        localeInit()
     t = gettext.dgettext(PluginLanguageDomain, txt)
     if t == txt:
         t = gettext.gettext(txt)
         if isDebug():
             print "[OSS] fallback to default Enigma2 Translation for", txt
+    translations[txt] = t
     return t
 
 def isDebug():
@@ -30,5 +44,4 @@ def isDebug():
         isDebug.mode = os.path.exists(resolveFilename(SCOPE_PLUGINS, "Extensions/OscamSkydeStatus/__debug__"))
         return isDebug.mode
 
-localeInit()
 language.addCallback(localeInit)
\ No newline at end of file
@@ -25,11 +25,13 @@
 #
 #######################################################################M
 
-import Plugins.Extensions.OscamSkydeStatus.OscamStatus as OscamStatus
 from Plugins.Plugin import PluginDescriptor
 from __init__ import _, isDebug
 
+# OscamStatus pulls in requests, json and the screen widgets. It is only
+# imported when the plugin is started, not during plugin enumeration at boot.
 def main(session, ** kwargs):
+    import Plugins.Extensions.OscamSkydeStatus.OscamStatus as OscamStatus
     print "[OSS] Start ", OscamStatus.OscamStatus.version
     if isDebug():
         print "[OSS] Start in debug mode"
@@ -43,9 +45,26 @@ def main(session, ** kwargs):
         session.open(OscamStatus.OscamStatus)
         
 
+# Background poller keeping card status warm, see Poller.py.
+# It imports OscamStatus itself on its first poll, not at session start.
+def sessionstart(reason, session=None, ** kwargs):
+    if reason == 0 and session:
+        import Plugins.Extensions.OscamSkydeStatus.Poller as Poller
+        Poller.startPoller(session)
+
+
+# The description is shown translated in the plugin list, so locale setup
+# runs here at enumeration. That is only binding the text domain; the
+# expensive part, importing OscamStatus, waits for main(). See
+# bench/bench_import.py.
 def Plugins( ** kwargs):
-    return PluginDescriptor(
+    return [
+        PluginDescriptor(
                 name="Oscam Skyde Status", 
                 description=_("V13/V14 Status auslesen und Entis verlängern"), 
                 where=PluginDescriptor.WHERE_PLUGINMENU, 
-                fnc=main)
+                fnc=main),
+        PluginDescriptor(
+                where=PluginDescriptor.WHERE_SESSIONSTART, 
+                fnc=sessionstart),
+    ]